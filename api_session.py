@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from typing import Any, Mapping
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiogram.methods import TelegramMethod
+from aiohttp import ClientTimeout
+
+logger = logging.getLogger(__name__)
+
+# Тайм-ауты по методам, с; остальные методы — `default_timeout`.
+# Ответ пользователю бесполезен через минуту, а загрузка файла может идти долго
+DEFAULT_METHOD_TIMEOUTS: dict[str, float] = {
+    "sendMessage": 10.0,
+    "editMessageText": 10.0,
+    "deleteMessage": 10.0,
+    "deleteMessages": 10.0,
+    "getMe": 10.0,
+    "getWebhookInfo": 10.0,
+    "setWebhook": 15.0,
+    "deleteWebhook": 15.0,
+    "sendDocument": 120.0,
+    "sendMediaGroup": 120.0,
+}
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """
+    Сессия Bot API с настроенным пулом соединений.
+
+    Соединения держатся открытыми `keepalive` секунд, DNS кэшируется на `dns_ttl`,
+    у каждого метода свой тайм-аут и отдельный короткий тайм-аут на установку
+    соединения. `warm_up` открывает соединения при старте, чтобы TLS-рукопожатие
+    не попадало в ответ первому пользователю.
+    """
+
+    def __init__(
+        self,
+        api_url: str | None = None,
+        pool_size: int = 100,
+        pool_size_per_host: int = 0,
+        keepalive: float = 30.0,
+        dns_ttl: int = 3600,
+        connect_timeout: float = 5.0,
+        default_timeout: float = 60.0,
+        method_timeouts: Mapping[str, float] = DEFAULT_METHOD_TIMEOUTS,
+        **kwargs: Any,
+    ):
+        api = TelegramAPIServer.from_base(api_url) if api_url else PRODUCTION
+        super().__init__(api=api, limit=pool_size, timeout=default_timeout, **kwargs)
+        self._connector_init.update(
+            limit_per_host=pool_size_per_host,
+            keepalive_timeout=keepalive,
+            ttl_dns_cache=dns_ttl,
+        )
+        self.connect_timeout = connect_timeout
+        # ClientTimeout на каждый метод собираем один раз, а не на каждый запрос
+        self._timeouts = {
+            method: ClientTimeout(total=timeout, sock_connect=connect_timeout)
+            for method, timeout in method_timeouts.items()
+        }
+        self._default_timeout = ClientTimeout(total=default_timeout, sock_connect=connect_timeout)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None) -> Any:
+        if timeout is None:
+            timeout = self._timeouts.get(method.__api_method__, self._default_timeout)
+        else:
+            timeout = ClientTimeout(total=timeout, sock_connect=self.connect_timeout)
+        return await super().make_request(bot, method, timeout=timeout)
+
+    async def warm_up(self, bot: Bot, connections: int = 1) -> None:
+        """Открывает `connections` соединений к Bot API параллельными getMe; первый заодно заполняет кеш `bot.me()`"""
+        await self.create_session()
+        results = await asyncio.gather(
+            bot.me(), *(bot.get_me() for _ in range(connections - 1)), return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            # Не повод не стартовать: соединение откроется на первом настоящем запросе
+            logger.warning("Прогрев соединений с Bot API: %d из %d не удалось: %r", len(errors), connections, errors[0])
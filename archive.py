@@ -0,0 +1,294 @@
+import asyncio
+import re
+import sqlite3
+import time
+from typing import Any, AsyncIterator, Callable, Mapping, NamedTuple, Sequence, TypeVar
+
+# Слова запроса; всё остальное (кавычки, звёздочки, скобки) — не синтаксис FTS5, а разделители
+_TERM_RE = re.compile(r"\w+")
+
+# Границы подсветки в сниппете — управляющие символы, которых нет в ответах
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+T = TypeVar("T")
+
+
+class SearchPage(NamedTuple):
+    search_id: int
+    query: str
+    page: int
+    pages: int
+    offset: int
+    total: int
+    hits: list[dict[str, Any]]
+
+
+def build_match_query(query: str) -> str | None:
+    """Текст запроса → выражение MATCH: все слова обязательны, каждое — как префикс"""
+    terms = _TERM_RE.findall(query)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def make_snippet(values: Sequence[str | None], query: str, words: int = 12) -> str:
+    """
+    Фрагмент поля, где совпало больше всего слов запроса, с подсвеченными совпадениями.
+
+    Строится в Python по уже прочитанной строке: snippet() FTS5 под ORDER BY
+    вычисляется для каждой сортируемой строки, а не только для страницы.
+    """
+    pattern = re.compile(
+        r"(?<!\w)(?:" + "|".join(re.escape(term) for term in _TERM_RE.findall(query)) + r")\w*", re.IGNORECASE,
+    )
+    best, best_count = None, 0
+    for value in values:
+        count = len({match.lower() for match in pattern.findall(value)}) if value else 0
+        if count > best_count:
+            best, best_count = value, count
+    if best is None:
+        return ""
+
+    tokens = best.split()
+    first = next((index for index, token in enumerate(tokens) if pattern.search(token)), 0)
+    start = max(0, min(first - 3, len(tokens) - words))
+    fragment = " ".join(tokens[start:start + words])
+    fragment = pattern.sub(lambda match: f"{HIGHLIGHT_START}{match.group(0)}{HIGHLIGHT_END}", fragment)
+    return ("…" if start else "") + fragment + ("…" if start + words < len(tokens) else "")
+
+
+class ApplicationArchive:
+    """
+    Архив заявок в SQLite с полнотекстовым индексом FTS5.
+
+    Каждая заявка — строка `applications` со столбцом на каждое поле анкеты
+    (ключи те же, что в данных FSM). Индекс `applications_fts` хранит только
+    токены и ссылается на строки по rowid; при изменении списка полей столбцы
+    добавляются, а индекс перестраивается. Поиск — по префиксам слов (без
+    морфологии: «кухн» найдёт и «кухня», и «кухонный»), с ранжированием BM25
+    среди `rank_window` самых новых совпадений.
+    """
+
+    def __init__(self, path: str, fields: Sequence[str], page_size: int = 5, rank_window: int = 2000):
+        for field in fields:
+            if not field.isidentifier():
+                raise ValueError(f"Недопустимое имя поля архива: {field!r}")
+        self.fields = tuple(fields)
+        self.page_size = page_size
+        # Окно ранжирования кратно странице, чтобы страница не разрывалась на две сортировки
+        self.rank_window = -(-rank_window // page_size) * page_size
+        self._columns = ", ".join(f'"{field}"' for field in self.fields)
+        self._placeholders = ", ".join("?" for _ in self.fields)
+        self._select_columns = ", ".join(f'a."{field}"' for field in self.fields)
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._db_lock = asyncio.Lock()
+
+    def _migrate(self) -> None:
+        db = self._db
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS applications ("
+            " id INTEGER PRIMARY KEY,"
+            " key TEXT NOT NULL UNIQUE,"
+            " chat_id INTEGER,"
+            " created_at REAL NOT NULL)"
+        )
+        db.execute("CREATE TABLE IF NOT EXISTS searches (id INTEGER PRIMARY KEY, query TEXT NOT NULL UNIQUE)")
+        existing = {row[1] for row in db.execute("PRAGMA table_info(applications)")}
+        for field in self.fields:
+            if field not in existing:
+                try:
+                    db.execute(f'ALTER TABLE applications ADD COLUMN "{field}" TEXT')
+                except sqlite3.OperationalError as e:
+                    # Соседний воркер успел добавить столбец раньше
+                    if "duplicate column" not in str(e):
+                        raise
+
+        indexed = tuple(row[1] for row in db.execute("PRAGMA table_info(applications_fts)"))
+        if indexed != self.fields:
+            with db:
+                db.execute("BEGIN")
+                db.execute("DROP TABLE IF EXISTS applications_fts")
+                db.execute(
+                    f"CREATE VIRTUAL TABLE applications_fts USING fts5({self._columns},"
+                    " content='applications', content_rowid='id',"
+                    " tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                )
+                db.execute("INSERT INTO applications_fts (applications_fts) VALUES ('rebuild')")
+
+    # ——— ЗАПИСЬ ———
+    async def add(self, key: str, chat_id: int | None, data: Mapping[str, Any]) -> None:
+        """Сохраняет заявку; повтор с тем же ключом ничего не меняет"""
+        values = [None if data.get(field) is None else str(data[field]) for field in self.fields]
+        await self._in_thread(self._insert, key, chat_id, time.time(), values)
+
+    def _insert(self, key: str, chat_id: int | None, created_at: float, values: list[str | None]) -> None:
+        with self._db:
+            self._db.execute("BEGIN")
+            cursor = self._db.execute(
+                f"INSERT OR IGNORE INTO applications (key, chat_id, created_at, {self._columns})"
+                f" VALUES (?, ?, ?, {self._placeholders})",
+                (key, chat_id, created_at, *values),
+            )
+            if cursor.rowcount:
+                self._db.execute(
+                    f"INSERT INTO applications_fts (rowid, {self._columns}) VALUES (?, {self._placeholders})",
+                    (cursor.lastrowid, *values),
+                )
+
+    # ——— ПОИСК ———
+    async def search(self, query: str, page: int = 0) -> SearchPage | None:
+        """Страница результатов по тексту запроса; None, если в запросе нет ни одного слова"""
+        if build_match_query(query) is None:
+            return None
+        return await self._in_thread(self._search, query, page)
+
+    async def search_by_id(self, search_id: int, page: int) -> SearchPage | None:
+        """Другая страница уже выполненного запроса (id приходит из кнопки листания)"""
+        return await self._in_thread(self._search_saved, search_id, page)
+
+    def _search_saved(self, search_id: int, page: int) -> SearchPage | None:
+        row = self._db.execute("SELECT query FROM searches WHERE id = ?", (search_id,)).fetchone()
+        return self._search(row[0], page) if row else None
+
+    def _search(self, query: str, page: int) -> SearchPage:
+        # Запрос целиком в callback_data кнопки не влезает (64 байта) — храним его в базе
+        self._db.execute("INSERT OR IGNORE INTO searches (query) VALUES (?)", (query,))
+        search_id = self._db.execute("SELECT id FROM searches WHERE query = ?", (query,)).fetchone()[0]
+
+        match = build_match_query(query)
+        total = self._db.execute(
+            "SELECT COUNT(*) FROM applications_fts WHERE applications_fts MATCH ?", (match,)
+        ).fetchone()[0]
+        pages = max(1, -(-total // self.page_size))
+        page = min(max(page, 0), pages - 1)
+        offset = page * self.page_size
+
+        # BM25 считается для каждого совпадения, и на частом слове это десятки мс.
+        # Поэтому по релевантности ранжируем только rank_window самых новых
+        # совпадений (FTS5 сужает rowid прямо в индексе), а более старые идут после
+        # них по дате — дальние страницы частых запросов всё равно листают по порядку
+        cutoff = 0
+        if total > self.rank_window:
+            cutoff = self._db.execute(
+                "SELECT rowid FROM applications_fts WHERE applications_fts MATCH ?"
+                " ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                (match, self.rank_window - 1),
+            ).fetchone()[0]
+        if offset < self.rank_window:
+            condition, order, skip = "applications_fts.rowid >= ?", "bm25(applications_fts)", offset
+        else:
+            condition, order, skip = "applications_fts.rowid < ?", "applications_fts.rowid DESC", offset - self.rank_window
+        cursor = self._db.execute(
+            f"SELECT a.id, a.created_at, {self._select_columns}"
+            " FROM applications_fts JOIN applications a ON a.id = applications_fts.rowid"
+            f" WHERE applications_fts MATCH ? AND {condition} ORDER BY {order} LIMIT ? OFFSET ?",
+            (match, cutoff, self.page_size, skip),
+        )
+        hits = []
+        for row in cursor:
+            hit = dict(zip(self.fields, row[2:]))
+            hit.update(id=row[0], created_at=row[1], snippet=make_snippet(row[2:], query))
+            hits.append(hit)
+        return SearchPage(search_id, query, page, pages, offset, total, hits)
+
+    # ——— ЧТЕНИЕ ———
+    async def rows_since(self, last_id: int, fields: Sequence[str], limit: int = 1000) -> list[tuple]:
+        """Заявки с id больше `last_id` по возрастанию id: (id, значения `fields`...)"""
+        unknown = set(fields) - set(self.fields)
+        if unknown:
+            raise ValueError(f"В архиве нет полей: {sorted(unknown)}")
+        columns = ", ".join(f'"{field}"' for field in fields)
+        return await self._in_thread(
+            lambda: self._db.execute(
+                f"SELECT id, {columns} FROM applications WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit),
+            ).fetchall()
+        )
+
+    # ——— ВЫГРУЗКА ———
+    def _export_filter(self, since: float | None, until: float | None, item_type: str | None) -> tuple[str, list]:
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            params.append(until)
+        match = build_match_query(item_type or "")
+        if match is not None:
+            # Изделие — свободный текст, поэтому фильтр тот же, что в /find, но только по этому столбцу
+            conditions.append("id IN (SELECT rowid FROM applications_fts WHERE applications_fts MATCH ?)")
+            params.append(f"item_type : ({match})")
+        return "".join(f" AND {condition}" for condition in conditions), params
+
+    async def export_bounds(
+        self, since: float | None = None, until: float | None = None, item_type: str | None = None,
+    ) -> tuple[int, int]:
+        """Сколько заявок попадёт в выгрузку и id последней из них — граница, новые заявки в выгрузку не попадут"""
+        where, params = self._export_filter(since, until, item_type)
+        total, last_id = await self._in_thread(
+            lambda: self._db.execute(
+                f"SELECT COUNT(*), MAX(id) FROM applications WHERE 1{where}", params,
+            ).fetchone()
+        )
+        return total, last_id or 0
+
+    async def iter_export(
+        self,
+        fields: Sequence[str],
+        last_id: int,
+        since: float | None = None,
+        until: float | None = None,
+        item_type: str | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[tuple]:
+        """
+        Строки выгрузки по возрастанию id до `last_id` включительно.
+
+        Читается пачками по `batch_size` с продолжением от последнего id: в
+        памяти не больше одной пачки, а между пачками архив свободен для записи.
+        Кроме полей анкеты можно запросить служебные `id` и `created_at`.
+        """
+        unknown = set(fields) - set(self.fields) - {"id", "created_at"}
+        if unknown:
+            raise ValueError(f"В архиве нет полей: {sorted(unknown)}")
+        columns = ", ".join(f'"{field}"' for field in fields)
+        where, params = self._export_filter(since, until, item_type)
+        sql = f"SELECT id, {columns} FROM applications WHERE id > ? AND id <= ?{where} ORDER BY id LIMIT ?"
+        after = 0
+        while after < last_id:
+            rows = await self._in_thread(
+                lambda: self._db.execute(sql, (after, last_id, *params, batch_size)).fetchall()
+            )
+            if not rows:
+                break
+            after = rows[-1][0]
+            for row in rows:
+                yield row[1:]
+            if len(rows) < batch_size:
+                break
+
+    async def count(self) -> int:
+        return await self._in_thread(lambda: self._db.execute("SELECT COUNT(*) FROM applications").fetchone()[0])
+
+    async def _in_thread(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Запрос к базе в отдельном потоке под `_db_lock`. Отмена ждущей задачи не
+        отпускает замок, пока поток не закончит: иначе `close` закрыл бы соединение
+        посреди запроса.
+        """
+        async with self._db_lock:
+            future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                await asyncio.gather(future, return_exceptions=True)
+                raise
+
+    async def close(self) -> None:
+        async with self._db_lock:
+            self._db.close()
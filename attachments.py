@@ -0,0 +1,61 @@
+from typing import Iterable, NamedTuple, Sequence
+
+from aiogram import Bot
+from aiogram.types import InputMediaDocument, InputMediaPhoto, InputMediaVideo, Message
+
+# Ограничения Telegram: элементов в альбоме и символов в подписи
+MEDIA_GROUP_LIMIT = 10
+CAPTION_LIMIT = 1024
+# Сколько вложений принимаем в одну заявку: больше — это уже не эскизы, а архив
+MAX_ATTACHMENTS = 20
+
+_INPUT_MEDIA = {"photo": InputMediaPhoto, "video": InputMediaVideo, "document": InputMediaDocument}
+_SEND_SINGLE = {"photo": "send_photo", "video": "send_video", "document": "send_document"}
+
+
+class Attachment(NamedTuple):
+    """Вложение заявки — только file_id на серверах Telegram, сами байты бот не скачивает"""
+    kind: str        # photo, video или document
+    file_id: str
+    caption: str = ""
+
+
+def extract_attachment(message: Message) -> Attachment | None:
+    if message.photo:
+        # Размеры фото идут по возрастанию — админу нужен самый большой
+        kind, file_id = "photo", message.photo[-1].file_id
+    elif message.video:
+        kind, file_id = "video", message.video.file_id
+    elif message.document:
+        kind, file_id = "document", message.document.file_id
+    else:
+        return None
+    return Attachment(kind, file_id, (message.caption or "")[:CAPTION_LIMIT])
+
+
+def plan_media_groups(attachments: Iterable[Sequence[str]]) -> list[list[Attachment]]:
+    """
+    Раскладывает вложения по альбомам: фото и видео вместе, документы отдельно
+    (Telegram не смешивает их в одном альбоме), не больше 10 в каждом.
+    """
+    items = [Attachment(*attachment) for attachment in attachments]
+    groups = []
+    for same_kind in (
+        [item for item in items if item.kind != "document"],
+        [item for item in items if item.kind == "document"],
+    ):
+        groups.extend(same_kind[i:i + MEDIA_GROUP_LIMIT] for i in range(0, len(same_kind), MEDIA_GROUP_LIMIT))
+    return groups
+
+
+async def send_media_group(bot: Bot, chat_id: int, group: Sequence[Attachment]) -> None:
+    """Один вызов Bot API на альбом; одиночное вложение — обычной отправкой (альбом — от двух)"""
+    if len(group) == 1:
+        item = group[0]
+        send = getattr(bot, _SEND_SINGLE[item.kind])
+        await send(chat_id, item.file_id, caption=item.caption or None, parse_mode=None)
+        return
+    await bot.send_media_group(chat_id, media=[
+        _INPUT_MEDIA[item.kind](media=item.file_id, caption=item.caption or None, parse_mode=None)
+        for item in group
+    ])
@@ -0,0 +1,77 @@
+"""
+Поиск по архиву заявок: задержка /find на десятках тысяч заявок.
+
+Заполняет архив синтетическими заявками из словаря типичных изделий и материалов
+и меряет p50/p99 поиска (подсчёт совпадений + страница с ранжированием BM25 и
+сниппетами) для частых, редких и многословных запросов, в том числе дальних страниц.
+
+    python benchmarks/bench_archive.py --applications 50000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import ApplicationArchive
+from form import APPLICATION_FIELDS
+
+ITEMS = ["Кухня угловая", "Кухня прямая", "Шкаф-купе", "Шкаф распашной", "Прихожая", "Гардеробная", "Тумба под ТВ"]
+DECORS = [
+    "Платиновый белый гладкий W980 SM Egger", "Дуб сонома светлый U103 ST9 Egger", "Вишня Риверсайд K077 PW Kronospan",
+    "Бетон Чикаго H1180 ST37 Egger", "Графит U961 ST2 Egger", "Кашемир U702 ST9 Egger", "Белый 0101 PE Kronospan",
+]
+QUERIES = ["egger", "кухн w980", "шкаф графит", "K077", "прихожая кашемир kronospan", "иванов"]
+
+
+def make_application(i: int, rng: random.Random) -> dict[str, str]:
+    data = {field: "нет" for field in APPLICATION_FIELDS}
+    data.update(
+        fio=f"{rng.choice(['Иванов', 'Петров', 'Смирнова', 'Кузнецов'])} {rng.choice(['Иван', 'Анна', 'Олег'])} #{i}",
+        telegram_contact=f"@user{i}",
+        telegram_user_id=str(i),
+        phone=f"8999{i:07d}",
+        item_type=rng.choice(ITEMS),
+        carcass_material=f"16мм ЛДСП {rng.choice(DECORS)}",
+        facade_material=f"Накладные 18мм МДФ {rng.choice(DECORS)}",
+        edge_banding="Корпус 1мм вкруг все детали, Фасады 2мм",
+        hinges=rng.choice(["Blum с доводчиком", "Hettich", "Крестовые на евровинтах"]),
+    )
+    return data
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--applications", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    applications = [make_application(i, rng) for i in range(args.applications)]
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ApplicationArchive(os.path.join(tmp, "archive.sqlite3"), APPLICATION_FIELDS)
+        started = time.perf_counter()
+        await asyncio.gather(*(archive.add(f"{i}:1", i, data) for i, data in enumerate(applications)))
+        elapsed = time.perf_counter() - started
+        print(f"заявок: {args.applications}, запись: {args.applications / elapsed:.0f} заявок/с")
+        print(f"{'запрос':<30} {'найдено':>8} {'стр.':>5} {'p50, мс':>8} {'p99, мс':>8}")
+
+        for query in QUERIES:
+            for page in (0, 50, 1000):
+                samples = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    result = await archive.search(query, page)
+                    samples.append(time.perf_counter() - started)
+                samples.sort()
+                print(f"{query:<30} {result.total:>8} {result.page + 1:>5} "
+                      f"{samples[len(samples) // 2] * 1e3:>8.2f} {samples[int(len(samples) * 0.99)] * 1e3:>8.2f}")
+        await archive.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
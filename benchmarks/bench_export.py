@@ -0,0 +1,138 @@
+"""
+Выгрузка /export: 100 тыс. заявок одним документом в фиксированном потолке памяти.
+
+Заполняет архив синтетическими заявками и отправляет выгрузку через настоящую
+сессию бота на локальный приёмник sendDocument, который читает multipart по
+кускам и выбрасывает. Пик памяти (tracemalloc, весь процесс вместе с
+приёмником) сравнивается с наивной выгрузкой — все строки fetchall и файл
+целиком в памяти. Если пик потоковой выгрузки выше --max-memory, код выхода 1.
+
+    python benchmarks/bench_export.py --applications 100000 --max-memory 16
+"""
+import argparse
+import asyncio
+import csv
+import datetime
+import io
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from aiohttp import web
+from aiohttp.test_utils import unused_port
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot
+
+from api_session import TunedAiohttpSession
+from archive import ApplicationArchive
+from bench_archive import make_application
+from export import ApplicationExport, ExportRequest
+from form import APPLICATION_FIELDS
+from render import EXPORT_COLUMNS
+
+CHAT_ID = 1
+
+
+class DocumentSink:
+    """Приёмник sendDocument: считает байты файла, не держа его в памяти"""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        reader = await request.multipart()
+        async for part in reader:
+            while chunk := await part.read_chunk():
+                if part.filename:
+                    self.received += len(chunk)
+        return web.json_response({"ok": True, "result": {
+            "message_id": 1, "date": int(time.time()), "chat": {"id": CHAT_ID, "type": "private"},
+        }})
+
+
+def naive_export(path: str) -> int:
+    """Как без потоковой выгрузки: вся история одним запросом и готовый файл в памяти"""
+    keys = [key for key, _ in EXPORT_COLUMNS]
+    db = sqlite3.connect(path)
+    rows = db.execute(f"SELECT {', '.join(keys)} FROM applications ORDER BY id").fetchall()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([label for _, label in EXPORT_COLUMNS])
+    for row in rows:
+        writer.writerow([
+            datetime.datetime.fromtimestamp(value).isoformat(" ", "seconds") if key == "created_at" else value
+            for key, value in zip(keys, row)
+        ])
+    data = buffer.getvalue().encode()
+    db.close()
+    return len(data)
+
+
+async def measure(coroutine) -> tuple[object, float, float]:
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = await coroutine
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--applications", type=int, default=100_000)
+    parser.add_argument("--max-memory", type=float, default=16.0, help="потолок пика памяти выгрузки, МиБ")
+    args = parser.parse_args()
+
+    sink = DocumentSink()
+    app = web.Application(client_max_size=0)
+    app.router.add_post("/bot{token}/sendDocument", sink.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = unused_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    bot = Bot("123456:bench", session=TunedAiohttpSession(api_url=f"http://127.0.0.1:{port}"))
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "archive.sqlite3")
+        archive = ApplicationArchive(path, APPLICATION_FIELDS)
+        started = time.perf_counter()
+
+        def fill() -> None:
+            for i in range(args.applications):
+                archive._insert(f"{i}:1", i, time.time(), [
+                    make_application(i, rng).get(field) for field in APPLICATION_FIELDS
+                ])
+        await asyncio.to_thread(fill)
+        print(f"заявок: {args.applications}, заполнение архива: {time.perf_counter() - started:.1f} с")
+
+        for request in (ExportRequest("csv"), ExportRequest("jsonl"), ExportRequest("csv", compress=True)):
+            total, last_id = await archive.export_bounds()
+            document = ApplicationExport(archive, EXPORT_COLUMNS, request, last_id)
+            estimate = await document.estimate_size(total)
+            sink.received = 0
+            _, elapsed, peak = await measure(bot.send_document(CHAT_ID, document))
+            verdict = "ok" if peak <= args.max_memory else f"ВЫШЕ ПОТОЛКА {args.max_memory:.0f} МиБ"
+            print(f"потоковая {document.filename.split('.', 1)[1]:<7} строк: {document.rows:>7} "
+                  f"файл: {sink.received / 2**20:6.1f} МиБ (оценка {estimate / 2**20:6.1f})  время: {elapsed:5.1f} с  пик памяти: {peak:5.1f} МиБ  {verdict}")
+            if peak > args.max_memory or document.rows != total:
+                sys.exit(1)
+
+        size, elapsed, peak = await measure(asyncio.to_thread(naive_export, path))
+        print(f"наивная csv     строк: {args.applications:>7} файл: {size / 2**20:6.1f} МиБ  "
+              f"время: {elapsed:5.1f} с  пик памяти: {peak:5.1f} МиБ")
+        await archive.close()
+
+    await bot.session.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""
+Что срезает FloodControl: операции хранилища и вызовы Bot API на всплеск апдейтов.
+
+Настоящий диспетчер бота и очередь webhook-обработчика, но Bot API — заглушка
+сессии, считающая вызовы; весь всплеск успевает встать в очередь чата до обработки.
+Два сценария, каждый без ограничения и с ним: вставка из 20 строк, пришедшая
+20 сообщениями на шаге «ФИО», и 100 стикеров подряд посреди анкеты. Плюс память
+вёдер после 100 тыс. разных пользователей: LRU против словаря без предела.
+
+    python benchmarks/bench_flood.py
+"""
+import asyncio
+import datetime
+import itertools
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, Message
+
+from loadtest import app_module
+from webhook import QueuedRequestHandler
+
+dp, storage, flood = app_module.dp, app_module.storage, app_module.flood
+update_ids = itertools.count(1)
+message_ids = itertools.count(1)
+# Значения по умолчанию из bot.py: rate, burst, окно склейки; окружение бенчмарков их отключает
+LIMITS = (1.0, 10.0, 0.3)
+STICKER = {"file_id": "s", "file_unique_id": "s", "type": "regular", "width": 1, "height": 1,
+           "is_animated": False, "is_video": False}
+
+
+class CountingSession(BaseSession):
+    """Bot API без сети: считает вызовы по методам"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls: Counter[str] = Counter()
+
+    async def make_request(self, bot: Any, method: Any, timeout: int | None = None) -> Any:
+        self.calls[method.__api_method__] += 1
+        if method.__returning__ is Message:
+            return Message(message_id=next(message_ids), date=datetime.datetime.now(),
+                           chat=Chat(id=method.chat_id, type="private"), text="ok")
+        return True
+
+    async def stream_content(self, *args: Any, **kwargs: Any):
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+def update(user_id: int, **message: Any) -> dict:
+    return {"update_id": next(update_ids), "message": {
+        "message_id": next(message_ids), "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"}, "from": {"id": user_id, "is_bot": False, "first_name": "Flood"},
+        **message,
+    }}
+
+
+async def feed(handler: QueuedRequestHandler, updates: list[dict]) -> None:
+    for item in updates:
+        handler.enqueue(app_module.bot, item)
+    while handler.queued:
+        await asyncio.sleep(0.01)
+
+
+async def scenario(handler: QueuedRequestHandler, user_id: int, burst: list[dict]) -> tuple[int, int]:
+    """Операции хранилища и вызовы Bot API на всплеск (без /start перед ним)"""
+    session = app_module.bot.session
+    await feed(handler, [update(user_id, text="/start")])
+    ops, calls = sum(storage.ops.values()), sum(session.calls.values())
+    await feed(handler, burst)
+    return sum(storage.ops.values()) - ops, sum(session.calls.values()) - calls
+
+
+def bucket_memory(max_users: int, users: int) -> float:
+    flood.max_users = max_users
+    flood._users.clear()
+    tracemalloc.start()
+    for user_id in range(users):
+        flood._user(1_000_000 + user_id)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    flood._users.clear()
+    return size / 2**20
+
+
+async def main() -> None:
+    app_module.bot.session = CountingSession()
+    dp.include_router(app_module.router)
+    print(f"{'сценарий':<28} {'ограничение':<12} {'операций хранилища':>19} {'вызовов Bot API':>16}")
+    user_ids = itertools.count(10_000)
+    merged = 0
+    for name, make_burst in (
+        ("вставка 20 строк", lambda user_id: [update(user_id, text=f"строка {i}") for i in range(20)]),
+        ("100 стикеров подряд", lambda user_id: [update(user_id, sticker=STICKER) for _ in range(100)]),
+    ):
+        for enabled in (False, True):
+            rate, burst, merge_window = LIMITS if enabled else (float("inf"), float("inf"), 0.0)
+            flood.rate, flood.burst = rate, burst
+            handler = QueuedRequestHandler(dp, app_module.bot, merge_window=merge_window)
+            user_id = next(user_ids)
+            ops, calls = await scenario(handler, user_id, make_burst(user_id))
+            merged += handler.merged
+            print(f"{name:<28} {'да' if enabled else 'нет':<12} {ops:>19} {calls:>16}")
+    print(f"отброшено: {flood.shed['dropped']}, склеено: {merged}")
+
+    for label, max_users in (("LRU на 10 тыс.", 10_000), ("без предела", sys.maxsize)):
+        print(f"вёдра после 100 тыс. пользователей, {label:<15} {bucket_memory(max_users, 100_000):6.1f} МиБ")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+"""
+Вызовы Bot API на заявку: FORM_MODE=messages против FORM_MODE=single.
+
+Тот же стенд, что в loadtest.py (заглушка Bot API + настоящее приложение), но
+пользователи отвечают с паузой на «набор текста»: фоновая очистка удаляет
+старые вопросы раз в секунду, и при живом темпе каждое удаление уходит
+отдельным deleteMessages. Режим single прогоняется дважды — ответы текстом и
+ответы кнопками частых значений там, где они есть. Печатает вызовы на заявку
+по методам и сколько из них упирается в лимит на чат (всё, где есть chat_id).
+
+    python benchmarks/bench_form_modes.py --users 20 --think-time 1.5
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+from collections import Counter
+
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import unused_port
+from aiogram.client.telegram import TelegramAPIServer
+
+from loadtest import ANSWERS, FakeBotAPI, Simulation, app_module
+from form import STEPS
+
+# Методы без chat_id планировщик не ограничивает
+UNLIMITED_METHODS = {"answerCallbackQuery", "setWebhook"}
+
+
+class FormSimulation(Simulation):
+    def __init__(self, *args, think_time: float, buttons: bool, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.think_time = think_time
+        self.buttons = buttons
+
+    def callback(self, user_id: int, message_id: int, data: str) -> dict:
+        return {
+            "update_id": next(self.update_ids),
+            "callback_query": {
+                "id": str(next(self.message_ids)),
+                "from": {"id": user_id, "is_bot": False, "first_name": "Load", "username": f"user{user_id}"},
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id, "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"}, "text": "",
+                },
+            },
+        }
+
+    async def send(self, http: ClientSession, user_id: int, label: str, update: dict) -> dict:
+        inbox = self.api.inboxes[user_id]
+        started = time.perf_counter()
+        async with http.post(self.webhook_url, json=update) as response:
+            response.raise_for_status()
+        reply = await asyncio.wait_for(inbox.get(), self.timeout)
+        self.latencies[label].append(time.perf_counter() - started)
+        return reply
+
+    async def user(self, http: ClientSession, user_id: int) -> None:
+        try:
+            reply = await self.send(http, user_id, "start", self.update(user_id, "/start"))
+            for index, step in enumerate(STEPS):
+                await asyncio.sleep(self.think_time)
+                if self.buttons and step.choices:
+                    data = app_module.FormButton(action="pick", step=index).pack()
+                    update = self.callback(user_id, reply["message_id"], data)
+                else:
+                    update = self.update(user_id, ANSWERS.get(step.key, "нет"))
+                reply = await self.send(http, user_id, step.state.state, update)
+            self.completed += 1
+        except (asyncio.TimeoutError, OSError) as e:
+            self.failed += 1
+            print(f"пользователь {user_id}: {e!r}", file=sys.stderr)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--think-time", type=float, default=1.5, help="пауза перед каждым ответом, с")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    # Считаем вызовы, а не ждём лимитов: планировщик пропускает всё сразу
+    app_module.scheduler.global_bucket.rate = app_module.scheduler.global_bucket.capacity = 1e6
+    app_module.scheduler.chat_rate = app_module.scheduler.chat_burst = 1e6
+
+    api = FakeBotAPI(latency=0.0, error_rate=0.0, retry_after=1)
+    api_runner = web.AppRunner(api.app())
+    await api_runner.setup()
+    api_port = unused_port()
+    await web.TCPSite(api_runner, "127.0.0.1", api_port).start()
+    app_module.bot.session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{api_port}")
+
+    bot_runner = web.AppRunner(app_module.build_app())
+    await bot_runner.setup()
+    bot_port = unused_port()
+    await web.TCPSite(bot_runner, "127.0.0.1", bot_port).start()
+    webhook_url = f"http://127.0.0.1:{bot_port}{app_module.WEBHOOK_PATH}"
+    # Как при запуске бота: прогрев заполняет кеш getMe, по нему решается кнопка подсказок
+    await app_module.session.warm_up(app_module.bot)
+
+    print(f"пользователей: {args.users}, пауза перед ответом: {args.think_time} с")
+    print(f"{'режим':<18} {'вызовов/заявку':>15} {'с лимитом чата':>15}  по методам")
+    first_user = 10_000
+    # Дедупликатор помнит update_id прошлых прогонов — нумерация сквозная
+    update_ids = itertools.count(1)
+    for mode, buttons in (("messages", False), ("single", False), ("single", True)):
+        app_module.FORM_MODE = mode
+        api.calls = Counter()
+        simulation = FormSimulation(
+            webhook_url, api, args.users, args.timeout, think_time=args.think_time, buttons=buttons,
+        )
+        simulation.update_ids = update_ids
+        async with ClientSession() as http:
+            await asyncio.gather(*(simulation.user(http, first_user + i) for i in range(args.users)))
+        first_user += args.users
+
+        deadline = time.monotonic() + args.timeout
+        while await app_module.outbox.pending_count() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        await app_module.cleaner.flush()
+
+        completed = max(simulation.completed, 1)
+        total = sum(api.calls.values())
+        limited = total - sum(api.calls[method] for method in UNLIMITED_METHODS)
+        per_method = {method: round(count / completed, 1) for method, count in api.calls.items()}
+        label = mode + (" + кнопки" if buttons else "")
+        print(f"{label:<18} {total / completed:>15.1f} {limited / completed:>15.1f}  "
+              f"{json.dumps(per_method, ensure_ascii=False)}")
+
+    await bot_runner.cleanup()
+    await api_runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""
+Экранирование MarkdownV2: прежняя посимвольная реализация против str.translate
+и цепочки str.replace,
+плюс сборка вопроса и текста заявки из предкомпилированных шаблонов.
+
+    python benchmarks/bench_render.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from form import STEPS
+from render import ADMIN_SUMMARY, PROMPTS, escape_markdown_v2
+
+_TABLE = str.maketrans({char: f"\\{char}" for char in "\\_*[]()~`>#+-=|{}.!"})
+
+
+def escape_markdown_v2_generator(text: str) -> str:
+    """Реализация из прежнего bot.py"""
+    escape_chars = r'_*[]()~`>#+-=|{}.!'
+    return ''.join(f'\\{char}' if char in escape_chars else char for char in text)
+
+
+MATERIAL = (
+    "16мм ЛДСП Платиновый белый гладкий W980 SM Egger (корпус), "
+    "фасады — МДФ 18мм [эмаль RAL-9003], кромка 2.0/0.4 мм; "
+    "петли Blum #71B3550 +доводчик, ручки 128-160мм {чёрный матовый}! "
+)
+SAMPLES = {
+    "короткая строка": "16мм ЛДСП W980 SM Egger",
+    "описание материалов": MATERIAL,
+    "длинное описание (x20)": MATERIAL * 20,
+}
+ANSWERS = {step.key: MATERIAL for step in STEPS}
+ANSWERS["telegram_contact"] = "@ivanov"
+
+
+def bench(label: str, func, number: int) -> float:
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"  {label:<34} {seconds * 1e6:>9.2f} мкс")
+    return seconds
+
+
+def main() -> None:
+    for name, text in SAMPLES.items():
+        assert escape_markdown_v2_generator(text) == escape_markdown_v2(text) == text.translate(_TABLE)
+        number = 20_000 if len(text) < 1000 else 1_000
+        print(f"{name} ({len(text)} симв.):")
+        old = bench("генератор + `in`", lambda: escape_markdown_v2_generator(text), number)
+        bench("str.translate", lambda: text.translate(_TABLE), number)
+        new = bench("цепочка str.replace", lambda: escape_markdown_v2(text), number)
+        print(f"  ускорение: x{old / new:.1f}")
+
+    print("шаблоны:")
+    bench("вопрос с подстановкой ФИО", lambda: PROMPTS[STEPS[1].state.state].render(ANSWERS), 50_000)
+    bench("вопрос без подстановок", lambda: PROMPTS[STEPS[5].state.state].render(ANSWERS), 50_000)
+    bench("текст заявки для админа", lambda: ADMIN_SUMMARY.render(ANSWERS), 50_000)
+
+
+if __name__ == "__main__":
+    main()
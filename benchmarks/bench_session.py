@@ -0,0 +1,115 @@
+"""
+Задержка Bot API: стандартная AiohttpSession против TunedAiohttpSession с прогревом.
+
+Между ботом и локальной заглушкой Bot API стоит TCP-прокси, который задерживает
+каждое новое соединение на --handshake секунд — так эмулируется TCP+TLS-рукопожатие
+с api.telegram.org, которого у локального HTTP нет. Меряется первый ответ после
+старта (то, что видит первый пользователь после деплоя) и устоявшаяся задержка
+при --concurrency параллельных отправках, когда пул уже открыт.
+
+    python benchmarks/bench_session.py --handshake 0.15 --requests 500
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+from aiohttp.test_utils import unused_port
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_session import TunedAiohttpSession
+from loadtest import FakeBotAPI, percentile
+
+
+class HandshakeProxy:
+    """TCP-прокси, который отвечает на новое соединение только через `delay` секунд"""
+
+    def __init__(self, target_port: int, delay: float):
+        self.target_port = target_port
+        self.delay = delay
+        self.connections = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        await asyncio.sleep(self.delay)
+        upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", self.target_port)
+        await asyncio.gather(self._pipe(reader, upstream_writer), self._pipe(upstream_reader, writer))
+
+    @staticmethod
+    async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def measure(bot: Bot, requests: int, concurrency: int) -> tuple[float, list[float]]:
+    started = time.perf_counter()
+    await bot.send_message(chat_id=1, text="первый ответ")
+    first = time.perf_counter() - started
+
+    samples: list[float] = []
+
+    async def sender(count: int) -> None:
+        for _ in range(count):
+            started = time.perf_counter()
+            await bot.send_message(chat_id=1, text="ответ")
+            samples.append(time.perf_counter() - started)
+
+    # Первый круг открывает недостающие соединения и в устоявшуюся задержку не входит
+    await asyncio.gather(*(sender(1) for _ in range(concurrency)))
+    samples.clear()
+    await asyncio.gather(*(sender(requests // concurrency) for _ in range(concurrency)))
+    return first, samples
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--handshake", type=float, default=0.15, help="задержка установки соединения, с")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warm-connections", type=int, default=4)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=0.0, error_rate=0.0, retry_after=1)
+    api_runner = web.AppRunner(api.app())
+    await api_runner.setup()
+    api_port = unused_port()
+    await web.TCPSite(api_runner, "127.0.0.1", api_port).start()
+    proxy = HandshakeProxy(api_port, args.handshake)
+    proxy_server = await asyncio.start_server(proxy.handle, "127.0.0.1", 0)
+    api_url = f"http://localhost:{proxy_server.sockets[0].getsockname()[1]}"
+
+    print(f"рукопожатие: {args.handshake * 1e3:.0f} мс, запросов: {args.requests}, параллельно: {args.concurrency}")
+    print(f"{'сессия':<34} {'первый, мс':>11} {'p50, мс':>8} {'p99, мс':>8} {'соединений':>11}")
+    for label, make_session, warm in (
+        ("AiohttpSession", lambda: AiohttpSession(api=TelegramAPIServer.from_base(api_url)), False),
+        ("TunedAiohttpSession", lambda: TunedAiohttpSession(api_url=api_url), False),
+        ("TunedAiohttpSession + warm_up", lambda: TunedAiohttpSession(api_url=api_url), True),
+    ):
+        session = make_session()
+        bot = Bot("123456:bench", session=session)
+        if warm:
+            await session.warm_up(bot, args.warm_connections)
+        proxy.connections = 0
+        first, samples = await measure(bot, args.requests, args.concurrency)
+        await session.close()
+        print(f"{label:<34} {first * 1e3:>11.1f} {percentile(samples, 0.5) * 1e3:>8.2f} "
+              f"{percentile(samples, 0.99) * 1e3:>8.2f} {proxy.connections:>11}")
+
+    proxy_server.close()
+    await api_runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""
+Память на незавершённые анкеты: MemoryStorage против компактных записей SQLiteStorage.
+
+Создаёт N сессий, заполненных до середины анкеты, и меряет tracemalloc'ом,
+сколько памяти заняли структуры хранилища (сами строки ответов создаются
+заранее и в замер не входят — они одинаковы для обоих вариантов).
+
+    python benchmarks/bench_sessions.py --sessions 100000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from form import SESSION_FIELDS, STEPS
+from storage import SQLiteStorage
+
+
+def make_sessions(count: int, filled_steps: int) -> list[tuple[StorageKey, str, dict]]:
+    sessions = []
+    for i in range(count):
+        data = {"prev_bot_message_id": 1000 + i, "telegram_contact": f"@user{i}", "telegram_user_id": i}
+        for step in STEPS[:filled_steps]:
+            data[step.key] = f"{step.key} {i}"
+        sessions.append((StorageKey(bot_id=1, chat_id=i, user_id=i), STEPS[filled_steps].state.state, data))
+    return sessions
+
+
+async def measure(storage, sessions) -> int:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for key, state, data in sessions:
+        await storage.set_state(key, state)
+        await storage.set_data(key, data)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--filled-steps", type=int, default=len(STEPS) // 2)
+    args = parser.parse_args()
+
+    sessions = make_sessions(args.sessions, args.filled_steps)
+    memory_bytes = await measure(MemoryStorage(), sessions)
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(os.path.join(tmp, "fsm.sqlite3"), fields=SESSION_FIELDS)
+        compact_bytes = await measure(storage, sessions)
+        await storage.close()
+
+    per_100k = 100_000 / args.sessions
+    print(f"сессий: {args.sessions}, заполнено шагов: {args.filled_steps}")
+    print(f"MemoryStorage:  {memory_bytes / args.sessions:>7.0f} Б/сессию, {memory_bytes * per_100k / 2**20:>7.1f} МиБ на 100k")
+    print(f"SQLiteStorage:  {compact_bytes / args.sessions:>7.0f} Б/сессию, {compact_bytes * per_100k / 2**20:>7.1f} МиБ на 100k")
+    print(f"экономия:       {(memory_bytes - compact_bytes) * per_100k / 2**20:.1f} МиБ на 100k сессий")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+Сравнение SQLiteStorage с MemoryStorage.
+
+Каждый смоделированный пользователь проходит анкету так же, как это делают
+обработчики в bot.py: get_data → update_data → set_state на каждый шаг.
+Печатает ops/sec и p50/p99 задержки одной операции.
+
+    python benchmarks/bench_storage.py --users 3000 --steps 17
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from storage import SQLiteStorage
+
+
+def percentile(samples: list[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+async def simulate_user(storage, user_id: int, steps: int, latencies: list[float]) -> None:
+    key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+    for step in range(steps):
+        for op in (
+            lambda: storage.get_data(key),
+            lambda: storage.update_data(key, {f"field_{step}": "16мм ЛДСП W980 SM Egger", "prev_bot_message_id": step}),
+            lambda: storage.set_state(key, f"Form:step_{step}"),
+        ):
+            started = time.perf_counter()
+            await op()
+            latencies.append(time.perf_counter() - started)
+        # Пользователи отвечают не синхронно — перемешиваем их между шагами
+        await asyncio.sleep(0)
+
+
+async def run(name: str, storage, users: int, steps: int) -> None:
+    latencies: list[float] = []
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate_user(storage, uid, steps, latencies) for uid in range(users)))
+    if isinstance(storage, SQLiteStorage):
+        await storage.flush()
+    elapsed = time.perf_counter() - started
+    await storage.close()
+
+    print(
+        f"{name:<14} ops={len(latencies):>8}  ops/sec={len(latencies) / elapsed:>12,.0f}  "
+        f"p50={percentile(latencies, 0.50) * 1e6:>7.1f}µs  p99={percentile(latencies, 0.99) * 1e6:>7.1f}µs"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--steps", type=int, default=17)
+    args = parser.parse_args()
+
+    await run("MemoryStorage", MemoryStorage(), args.users, args.steps)
+    with tempfile.TemporaryDirectory() as tmp:
+        await run("SQLiteStorage", SQLiteStorage(os.path.join(tmp, "fsm.sqlite3")), args.users, args.steps)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
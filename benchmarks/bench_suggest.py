@@ -0,0 +1,107 @@
+"""
+Подсказки материалов: задержка ответа на inline-запрос по индексу прошлых ответов.
+
+Строит индексы по полям подсказок из синтетических заявок с каталогом в
+несколько тысяч декоров и меряет p50/p99 подсказки для префиксов разной длины —
+против прямого перебора всех различных ответов. Отдельно — цена добавления
+одной завершённой заявки в уже построенные индексы.
+
+    python benchmarks/bench_suggest.py --applications 50000 --decors 3000
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from form import SUGGEST_FIELDS
+from suggest import PrefixIndex, normalize
+
+BRANDS = ["Egger", "Kronospan", "Lamarty", "Nordeco", "Swiss Krono"]
+NAMES = ["Дуб сонома", "Платиновый белый", "Бетон Чикаго", "Графит", "Кашемир", "Вишня Риверсайд", "Орех",
+         "Ясень шимо", "Белый", "Серый камень", "Дуб Галифакс", "Антрацит"]
+QUERIES = ["", "1", "16мм лдсп", "дуб", "дуб сон", "egger", "w98", "h11", "kron"]
+
+
+def make_catalogue(size: int, rng: random.Random) -> list[str]:
+    return [
+        f"{rng.choice(['16мм', '18мм', '10мм'])} {rng.choice(['ЛДСП', 'МДФ', 'ХДФ'])} {rng.choice(NAMES)} "
+        f"{rng.choice('WUHK')}{rng.randint(100, 9999)} {rng.choice(['SM', 'ST9', 'PE', 'ST37'])} {rng.choice(BRANDS)}"
+        for _ in range(size)
+    ]
+
+
+def scan(answers: dict[str, list], prefix: str, limit: int = 20) -> list[str]:
+    """Без индекса: проверяем начало каждого слова каждого различного ответа"""
+    prefix = normalize(prefix)
+    found = [
+        (count, answer) for key, (answer, count) in answers.items()
+        if not prefix or any(key[i:].startswith(prefix) for i in [0, *(j + 1 for j, c in enumerate(key) if c == " ")])
+    ]
+    return [answer for _, answer in heapq.nlargest(limit, found)]
+
+
+def timed(fn, repeat: int) -> tuple[float, float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--applications", type=int, default=50_000)
+    parser.add_argument("--decors", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    catalogue = make_catalogue(args.decors, rng)
+    # Популярность декоров — по Ципфу: малая часть каталога покрывает большинство заявок
+    weights = [1 / (rank + 1) for rank in range(len(catalogue))]
+    applications = [rng.choices(catalogue, weights, k=len(SUGGEST_FIELDS)) for _ in range(args.applications)]
+
+    indexes = {field: PrefixIndex() for field in SUGGEST_FIELDS}
+    answers: dict[str, list] = {}
+    started = time.perf_counter()
+    for seen, values in enumerate(applications):
+        for field, value in zip(SUGGEST_FIELDS, values):
+            indexes[field].add(value, seen)
+    elapsed = time.perf_counter() - started
+    # Для перебора — те же ответы первого поля со счётчиками
+    for values in applications:
+        answers.setdefault(normalize(values[0]), [values[0], 0])[1] += 1
+
+    index = indexes[SUGGEST_FIELDS[0]]
+    print(f"заявок: {args.applications}, различных ответов в поле: {len(index)}, "
+          f"построение: {elapsed:.2f} с ({elapsed / args.applications * 1e6:.0f} мкс на заявку)")
+
+    extra = make_catalogue(args.repeat, rng)
+    seen = args.applications
+    samples = []
+    for value in extra:
+        started = time.perf_counter()
+        for field in SUGGEST_FIELDS:
+            indexes[field].add(value, seen)
+        samples.append(time.perf_counter() - started)
+        seen += 1
+    samples.sort()
+    print(f"новая заявка с новыми ответами: p50 {samples[len(samples) // 2] * 1e6:.0f} мкс, "
+          f"p99 {samples[int(len(samples) * 0.99)] * 1e6:.0f} мкс")
+
+    print(f"{'запрос':<12} {'индекс p50':>11} {'p99, мс':>8} {'перебор p50':>12} {'p99, мс':>8}")
+    for query in QUERIES:
+        index_p50, index_p99 = timed(lambda: index.suggest(query), args.repeat)
+        scan_p50, scan_p99 = timed(lambda: scan(answers, query), max(args.repeat // 20, 5))
+        print(f"{query!r:<12} {index_p50 * 1e3:>11.3f} {index_p99 * 1e3:>8.3f} "
+              f"{scan_p50 * 1e3:>12.3f} {scan_p99 * 1e3:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
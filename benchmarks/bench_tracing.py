@@ -0,0 +1,88 @@
+"""
+Цена трассировки и профайлера на пути апдейта.
+
+Трассировка: сколько микросекунд добавляют UpdateTracer и TracingRequestMiddleware
+к апдейту с одним вызовом Bot API (сам вызов — заглушка), когда порог медленного
+лога не достигается, как в обычной работе. Профайлер: замедление CPU-нагрузки
+(сборка текста заявки) при включённом сэмплировании; выключенный профайлер не
+стоит ничего — таймера нет.
+
+    python benchmarks/bench_tracing.py --iterations 100000
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import time
+from typing import Any
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message, Update
+
+from form import STEPS
+from profiler import Profile, SamplingProfiler
+from render import ADMIN_SUMMARY
+from tracing import TracingRequestMiddleware, UpdateTracer
+
+BOT = Bot("123456:bench")
+UPDATE = Update(update_id=1, message=Message(
+    message_id=1, date=datetime.datetime.now(), chat=Chat(id=1, type="private"), text="16мм ЛДСП W980",
+))
+METHOD = SendMessage(chat_id=1, text="ok")
+ANSWERS = {step.key: "16мм ЛДСП Платиновый белый W980 SM Egger" for step in STEPS}
+
+
+async def make_request(bot: Bot, method: Any) -> None:
+    pass
+
+
+async def bench(label: str, call, iterations: int, base: float | None = None) -> float:
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await call()
+        best = min(best, (time.perf_counter() - started) / iterations)
+    delta = f"  {(best - base) * 1e6:+.2f} мкс" if base is not None else ""
+    print(f"  {label:<36} {best * 1e6:8.2f} мкс{delta}")
+    return best
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    tracer = UpdateTracer(slow_threshold=60.0)
+    request_middleware = TracingRequestMiddleware()
+
+    async def plain_handler(event: Any, data: dict[str, Any]) -> None:
+        await make_request(BOT, METHOD)
+
+    async def traced_handler(event: Any, data: dict[str, Any]) -> None:
+        await request_middleware(make_request, BOT, METHOD)
+
+    print("апдейт с одним вызовом Bot API:")
+    base = await bench("без трассировки", lambda: plain_handler(UPDATE, {}), args.iterations)
+    await bench("с трассировкой", lambda: tracer(traced_handler, UPDATE, {}), args.iterations, base)
+
+    async def render() -> None:
+        ADMIN_SUMMARY.render(ANSWERS)
+
+    async def discard(profile: Profile) -> None:
+        pass
+
+    print("текст заявки (CPU):")
+    base = await bench("профайлер выключен", render, args.iterations // 5)
+    profiler = SamplingProfiler()
+    profiler.start(3600, discard)
+    await bench(f"сэмплирование раз в {profiler.interval * 1000:.0f} мс", render, args.iterations // 5, base)
+    await profiler.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+Масштабирование по процессам: апдейты в секунду при BOT_WORKERS = 1, 2, 4...
+
+Для каждого числа воркеров запускает `python bot.py` отдельным процессом против
+локальной заглушки Bot API из loadtest.py (лимиты отправки Telegram сняты, чтобы
+упираться в CPU, а не в планировщик) и прогоняет через фронтовой /webhook
+N пользователей, каждый из которых заполняет анкету целиком.
+
+Заглушка и генератор нагрузки живут в процессе бенчмарка и сами занимают ядро,
+так что прирост близок к линейному, пока воркеров меньше, чем свободных ядер.
+
+    python benchmarks/bench_workers.py --workers 1 2 4 --users 400
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import time
+
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import unused_port
+
+from loadtest import ADMIN_ID, FakeBotAPI, Simulation, percentile
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot.py")
+
+
+async def run(workers: int, users: int, api: FakeBotAPI, api_url: str, timeout: float) -> tuple[float, float]:
+    port = unused_port()
+    env = {
+        **os.environ,
+        "BOT_TOKEN": "123456:bench",
+        "YOUR_TELEGRAM_ID": str(ADMIN_ID),
+        "DATA_DIR": tempfile.mkdtemp(prefix="mebel-workers-"),
+        "PORT": str(port),
+        "WORKER_BASE_PORT": str(unused_port() + 1000),
+        "BOT_WORKERS": str(workers),
+        "BOT_API_URL": api_url,
+        "SEND_GLOBAL_RATE": "1000000",
+        "SEND_CHAT_RATE": "1000000",
+        "FLOOD_RATE": "1000000",
+        "FLOOD_BURST": "1000000",
+        "WEBHOOK_QUEUE_SIZE": str(users * 4),
+    }
+    # Каждый запуск — как первый деплой: бот сам поставит webhook
+    api.calls.clear()
+    api.webhook_url = ""
+    process = await asyncio.create_subprocess_exec(sys.executable, BOT_PATH, env=env)
+    try:
+        # Бот готов, когда поставил webhook
+        deadline = time.monotonic() + timeout
+        while not api.calls["setWebhook"]:
+            if process.returncode is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"бот не запустился (BOT_WORKERS={workers})")
+            await asyncio.sleep(0.05)
+
+        simulation = Simulation(f"http://127.0.0.1:{port}/webhook", api, users, timeout)
+        started = time.perf_counter()
+        async with ClientSession() as http:
+            await asyncio.gather(*(simulation.user(http, 10_000 + i) for i in range(users)))
+        elapsed = time.perf_counter() - started
+    finally:
+        process.send_signal(signal.SIGTERM)
+        await process.wait()
+
+    samples = [sample for step in simulation.latencies.values() for sample in step]
+    if simulation.failed:
+        print(f"  ошибок: {simulation.failed}", file=sys.stderr)
+    return len(samples) / elapsed, percentile(samples, 0.99)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=400)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=0.0, error_rate=0.0, retry_after=1)
+    api_runner = web.AppRunner(api.app())
+    await api_runner.setup()
+    api_port = unused_port()
+    await web.TCPSite(api_runner, "127.0.0.1", api_port).start()
+
+    print(f"ядер: {os.cpu_count()}, пользователей: {args.users}")
+    print(f"{'воркеров':>8} {'апдейтов/с':>11} {'x к 1':>7} {'p99, мс':>9}")
+    baseline = None
+    for workers in args.workers:
+        throughput, p99 = await run(workers, args.users, api, f"http://127.0.0.1:{api_port}", args.timeout)
+        baseline = baseline or throughput
+        print(f"{workers:>8} {throughput:>11.1f} {throughput / baseline:>7.2f} {p99 * 1e3:>9.1f}")
+
+    await api_runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,231 @@
+"""
+Нагрузочный тест бота без Telegram.
+
+Поднимает локальную заглушку Bot API (записывает вызовы, умеет задержку и 429),
+запускает настоящее приложение из bot.build_app() и гоняет через /webhook
+N одновременных пользователей, каждый из которых проходит все шаги Form до
+finalize_application. Печатает пропускную способность, p50/p95/p99 по шагам,
+вызовы Bot API на заявку и RSS на активную сессию.
+
+    python benchmarks/loadtest.py --users 200 --api-latency 0.05 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ADMIN_ID = 1
+os.environ.setdefault("BOT_TOKEN", "123456:loadtest")
+os.environ.setdefault("YOUR_TELEGRAM_ID", str(ADMIN_ID))
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="mebel-loadtest-"))
+# Виртуальные пользователи отвечают быстрее живых — ограничение входящих их бы отбрасывало
+os.environ.setdefault("FLOOD_RATE", "1000000")
+os.environ.setdefault("FLOOD_BURST", "1000000")
+
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import unused_port
+from aiogram.client.telegram import TelegramAPIServer
+
+import bot as app_module
+from form import STEPS
+
+ANSWERS = {
+    "fio": "Иванов Иван Иванович",
+    "phone": "89991234567",
+    "item_type": "Шкаф Малиновая д15 кв25",
+    "carcass_material": "16мм ЛДСП Платиновый белый гладкий W980 SM Egger",
+    "facade_material": "Накладные 16мм ЛДСП Вишня Риверсайд Светлая K077 PW Kronospan",
+    "additional_description": "нет",
+}
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def percentile(samples: list[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else 0.0
+
+
+# ——— ЗАГЛУШКА BOT API ———
+class FakeBotAPI:
+    def __init__(self, latency: float, error_rate: float, retry_after: int):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.calls: Counter[str] = Counter()
+        self.errors = 0
+        self.inboxes: defaultdict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self.webhook_url = ""
+        self._message_ids = itertools.count(1)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method != "setWebhook" and random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            })
+
+        result: object = True
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params["chat_id"])
+            result = {
+                "message_id": int(params.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+            self.inboxes[chat_id].put_nowait(result)
+        elif method == "setWebhook":
+            self.webhook_url = params["url"]
+        elif method == "deleteWebhook":
+            self.webhook_url = ""
+        elif method == "getWebhookInfo":
+            result = {"url": self.webhook_url, "has_custom_certificate": False, "pending_update_count": 0}
+        elif method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "loadtest", "username": "loadtest_bot",
+                      "supports_inline_queries": True}
+        return web.json_response({"ok": True, "result": result})
+
+
+# ——— СИМУЛЯЦИЯ ПОЛЬЗОВАТЕЛЕЙ ———
+class Simulation:
+    def __init__(self, webhook_url: str, api: FakeBotAPI, users: int, timeout: float):
+        self.webhook_url = webhook_url
+        self.api = api
+        self.timeout = timeout
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.latencies: defaultdict[str, list[float]] = defaultdict(list)
+        self.completed = 0
+        self.failed = 0
+        # Все пользователи встречаются в середине анкеты — в этот момент меряем RSS
+        self.midpoint = asyncio.Barrier(users)
+        self.rss_at_midpoint = 0
+
+    def update(self, user_id: int, text: str) -> dict:
+        return {
+            "update_id": next(self.update_ids),
+            "message": {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Load", "username": f"user{user_id}"},
+                "text": text,
+            },
+        }
+
+    async def step(self, http: ClientSession, user_id: int, label: str, text: str) -> None:
+        inbox = self.api.inboxes[user_id]
+        started = time.perf_counter()
+        async with http.post(self.webhook_url, json=self.update(user_id, text)) as response:
+            response.raise_for_status()
+        await asyncio.wait_for(inbox.get(), self.timeout)
+        self.latencies[label].append(time.perf_counter() - started)
+
+    async def user(self, http: ClientSession, user_id: int) -> None:
+        try:
+            await self.step(http, user_id, "start", "/start")
+            for index, step in enumerate(STEPS):
+                if index == len(STEPS) // 2:
+                    if await self.midpoint.wait() == 0:
+                        self.rss_at_midpoint = rss_bytes()
+                await self.step(http, user_id, step.state.state, ANSWERS.get(step.key, "нет"))
+            self.completed += 1
+        except (asyncio.TimeoutError, OSError) as e:
+            self.failed += 1
+            print(f"пользователь {user_id}: {e!r}", file=sys.stderr)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка заглушки Bot API, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--global-rate", type=float, help="переопределить глобальный лимит отправки, msg/s")
+    parser.add_argument("--chat-rate", type=float, help="переопределить лимит на чат, msg/s")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    if args.global_rate:
+        app_module.scheduler.global_bucket.rate = app_module.scheduler.global_bucket.capacity = args.global_rate
+    if args.chat_rate:
+        app_module.scheduler.chat_rate = args.chat_rate
+        app_module.scheduler.chat_burst = max(args.chat_rate, app_module.scheduler.chat_burst)
+
+    api = FakeBotAPI(args.api_latency, args.error_rate, args.retry_after)
+    api_runner = web.AppRunner(api.app())
+    await api_runner.setup()
+    api_port = unused_port()
+    await web.TCPSite(api_runner, "127.0.0.1", api_port).start()
+    app_module.bot.session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{api_port}")
+
+    bot_runner = web.AppRunner(app_module.build_app())
+    await bot_runner.setup()
+    bot_port = unused_port()
+    await web.TCPSite(bot_runner, "127.0.0.1", bot_port).start()
+    webhook_url = f"http://127.0.0.1:{bot_port}{app_module.WEBHOOK_PATH}"
+    await app_module.bot.set_webhook(url=webhook_url)
+    # Как при запуске бота: прогрев заполняет кеш getMe, по нему решается кнопка подсказок
+    await app_module.session.warm_up(app_module.bot)
+
+    simulation = Simulation(webhook_url, api, args.users, args.timeout)
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    async with ClientSession() as http:
+        await asyncio.gather(*(simulation.user(http, 10_000 + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    # Ждём, пока outbox доставит заявки админу
+    deadline = time.monotonic() + args.timeout
+    while await app_module.outbox.pending_count() and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    await app_module.cleaner.flush()
+
+    await bot_runner.cleanup()
+    await api_runner.cleanup()
+
+    updates = sum(len(samples) for samples in simulation.latencies.values())
+    print(f"пользователей: {args.users}, заявок: {simulation.completed}, ошибок: {simulation.failed}, "
+          f"время: {elapsed:.2f} с")
+    print(f"пропускная способность: {updates / elapsed:.1f} апдейтов/с, {simulation.completed / elapsed:.2f} заявок/с")
+    print()
+    print(f"{'шаг':<32} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+    for label, samples in simulation.latencies.items():
+        print(f"{label:<32} {percentile(samples, 0.5) * 1e3:>9.1f} "
+              f"{percentile(samples, 0.95) * 1e3:>9.1f} {percentile(samples, 0.99) * 1e3:>9.1f}")
+    print()
+    total_calls = sum(api.calls.values()) - api.calls["setWebhook"]
+    print(f"вызовов Bot API на заявку: {total_calls / max(simulation.completed, 1):.1f} "
+          f"({json.dumps(dict(api.calls), ensure_ascii=False)}, 429: {api.errors})")
+    if simulation.rss_at_midpoint:
+        print(f"RSS на активную сессию: {(simulation.rss_at_midpoint - rss_before) / args.users / 1024:.1f} КиБ")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
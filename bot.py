@@ -1,540 +1,648 @@
+import time
+# Отсчёт фаз запуска начинаем до остальных импортов, чтобы в него попало и их время
+STARTED_AT = time.perf_counter()
 import os
 import asyncio
 import logging
+import signal
+import sys
 from aiogram import Bot, Dispatcher, Router, F
-from aiogram.types import Message
+from aiogram.types import (
+    BufferedInputFile, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, InlineQuery, InlineQueryResultArticle,
+    InputTextMessageContent, Message,
+)
+from aiogram.filters import Command, CommandObject, StateFilter
+from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from aiogram.client.default import DefaultBotProperties
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiogram.webhook.aiohttp_server import setup_application
 from aiohttp import web
 
-def escape_markdown_v2(text: str) -> str:
-    """Экранирует спецсимволы для MarkdownV2"""
-    escape_chars = r'_*[]()~`>#+-=|{}.!'
-    return ''.join(f'\\{char}' if char in escape_chars else char for char in text)
+from api_session import TunedAiohttpSession
+from archive import ApplicationArchive, SearchPage
+from attachments import MAX_ATTACHMENTS, extract_attachment
+from cleanup import PromptCleaner
+from cluster import WORKER_INDEX_ENV, WORKER_PORT_ENV, ChatRouter, WorkerPool, watch_parent
+from export import UPLOAD_LIMIT, ApplicationExport, parse_export_args
+from flood import FloodControl
+from form import (
+    APPLICATION_FIELDS, Form, InvalidAnswer, NEXT_STEP, PREV_STEP, SESSION_FIELDS, STEP_BY_STATE, STEP_INDEX, STEPS,
+    SUGGEST_FIELDS, Step,
+)
+from metrics import Metrics, MetricsMiddleware, MetricsRequestMiddleware
+from outbox import Outbox
+from profiler import Profile, SamplingProfiler
+from render import (
+    ADMIN_SUMMARY, BACK_BUTTON, DONE_MESSAGE, EXPORT_COLUMNS, EXPORT_EMPTY, EXPORT_TOO_LARGE, EXPORT_USAGE, FIND_USAGE,
+    FLOOD_NOTICE, PROMPTS, PROFILE_BUSY, PROFILE_USAGE, SKIP_BUTTON, START_PROMPT, SUGGEST_BUTTON, attachments_note, export_caption,
+    profile_caption, profile_started, render_form_card, render_search_page, suggestion_description,
+    summary_attachments_line,
+)
+from startup import StartupTimer, ensure_webhook
+from storage import SQLiteStorage
+from suggest import AnswerSuggestions
+from throttle import SendScheduler
+from tracing import TracingRequestMiddleware, UpdateTracer
+from webhook import QueuedRequestHandler, UpdateDeduplicator
+
+logger = logging.getLogger(__name__)
+startup_timer = StartupTimer(STARTED_AT)
+startup_timer.mark("импорт")
 
 # ——— ЗАГРУЗКА НАСТРОЕК ИЗ .env ———
 TOKEN = os.getenv("BOT_TOKEN")
 YOUR_TELEGRAM_ID = int(os.getenv("YOUR_TELEGRAM_ID"))
+# Каталог для локальных данных (на Render — persistent disk)
+DATA_DIR = os.getenv("DATA_DIR", ".")
+FSM_DB_PATH = os.getenv("FSM_DB_PATH", os.path.join(DATA_DIR, "fsm.sqlite3"))
+OUTBOX_DB_PATH = os.getenv("OUTBOX_DB_PATH", os.path.join(DATA_DIR, "outbox.sqlite3"))
+ARCHIVE_DB_PATH = os.getenv("ARCHIVE_DB_PATH", os.path.join(DATA_DIR, "archive.sqlite3"))
+# Сколько апдейтов обрабатываем параллельно и сколько держим в очереди
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+# Через сколько секунд брошенная анкета удаляется из хранилища
+SESSION_TTL = float(os.getenv("SESSION_TTL", "604800"))
+# Через сколько секунд тишины незавершённая анкета считается брошенной (для метрик)
+SESSION_ABANDON_AFTER = float(os.getenv("SESSION_ABANDON_AFTER", "3600"))
+UPDATE_HWM_PATH = os.getenv("UPDATE_HWM_PATH", os.path.join(DATA_DIR, "last_update_id"))
+# Секрет, который Telegram присылает в заголовке каждого апдейта; пусто — без проверки
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+# Отпечаток установленного webhook: по нему при старте решаем, нужен ли setWebhook
+WEBHOOK_STATE_PATH = os.getenv("WEBHOOK_STATE_PATH", os.path.join(DATA_DIR, "webhook_state"))
+# Адрес Bot API (свой сервер или локальная заглушка); пусто — api.telegram.org
+BOT_API_URL = os.getenv("BOT_API_URL")
+# Пул соединений к Bot API: размер, сколько держать простаивающее соединение,
+# сколько открыть заранее при старте
+BOT_API_POOL_SIZE = int(os.getenv("BOT_API_POOL_SIZE", "100"))
+BOT_API_KEEPALIVE = float(os.getenv("BOT_API_KEEPALIVE", "30"))
+BOT_API_WARM_CONNECTIONS = int(os.getenv("BOT_API_WARM_CONNECTIONS", "4"))
+# Лимиты отправки Telegram: сообщений в секунду на бота и на чат
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+# Число процессов-воркеров; при BOT_WORKERS > 1 этот процесс только раздаёт апдейты по чатам
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "10100"))
+# Как идёт анкета: "messages" — каждый вопрос новым сообщением, прошлый удаляется;
+# "single" — одно сообщение на анкету, вопрос и сводка ответов меняются правкой
+FORM_MODE = os.getenv("FORM_MODE", "messages")
+if FORM_MODE not in ("messages", "single"):
+    raise ValueError(f"FORM_MODE должен быть messages или single, а не {FORM_MODE!r}")
+# Входящие сообщения от одного пользователя: в секунду и запас на всплеск; сверх — отбрасываются
+# (альбом — одно сообщение, кнопки и inline-запросы не ограничиваются)
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", "1"))
+FLOOD_BURST = float(os.getenv("FLOOD_BURST", "10"))
+# Текст, присланный несколькими сообщениями подряд с паузами не больше стольких секунд,
+# обрабатывается как один ответ. Ждут частей только чаты, где апдейты уже копятся в очереди. 0 — не склеивать
+FLOOD_MERGE_WINDOW = float(os.getenv("FLOOD_MERGE_WINDOW", "0.3"))
+# Апдейты дольше стольких секунд пишутся в лог с разбивкой по спанам (Bot API, хранилище)
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "1.0"))
+# Номер воркера выставляет фронтовой процесс; None — процесс сам принимает webhook
+WORKER_INDEX = int(os.environ[WORKER_INDEX_ENV]) if WORKER_INDEX_ENV in os.environ else None
 
-# ——— FSM ———
-class Form(StatesGroup):
-    fio = State()
-    phone = State()
-    item_type = State()
-    carcass_material = State()
-    facade_material = State()
-    visible_sides_material = State()
-    back_wall = State()
-    countertop_and_wall_panel = State()
-    canopy_height = State()
-    plinth_height = State()
-    edge_banding = State()
-    bottom_and_top_type = State()
-    technical_gaps = State()
-    hinges = State()
-    supports = State()
-    drawers = State()
-    additional_info = State()
-    
 # ——— ИНИЦИАЛИЗАЦИЯ ———
-bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN_V2))
-dp = Dispatcher(storage=MemoryStorage())
+session = TunedAiohttpSession(api_url=BOT_API_URL, pool_size=BOT_API_POOL_SIZE, keepalive=BOT_API_KEEPALIVE)
+bot = Bot(token=TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN_V2))
+# Спаны Bot API в трассе апдейта — снаружи планировщика, вместе с ожиданием лимитов
+bot.session.middleware(TracingRequestMiddleware())
+# Все исходящие запросы идут через планировщик с лимитами Telegram; чаты закреплены
+# за воркерами, так что делится между процессами только общий лимит
+scheduler = SendScheduler(
+    global_rate=SEND_GLOBAL_RATE / BOT_WORKERS, chat_rate=SEND_CHAT_RATE, background_chats={YOUR_TELEGRAM_ID},
+)
+bot.session.middleware(scheduler)
+# Метрики Bot API снимаем внутри планировщика — без времени ожидания в очереди
+metrics = Metrics([step.state.state for step in STEPS])
+bot.session.middleware(MetricsRequestMiddleware(metrics))
+storage = SQLiteStorage(FSM_DB_PATH, fields=SESSION_FIELDS, session_ttl=SESSION_TTL)
+dp = Dispatcher(storage=storage)
+# Ограничение частоты — раньше всего остального: лишний апдейт не трогает ни хранилище, ни Bot API.
+# Трасса охватывает и чтение состояния, поэтому тоже стоит раньше FSM-middleware
+flood = FloodControl(
+    rate=FLOOD_RATE, burst=FLOOD_BURST, exempt={YOUR_TELEGRAM_ID}, notice=FLOOD_NOTICE,
+)
+tracer = UpdateTracer(TRACE_SLOW_SECONDS)
+dp.update.outer_middleware.unregister(dp.fsm)
+dp.update.outer_middleware(flood)
+dp.update.outer_middleware(tracer)
+dp.update.outer_middleware(dp.fsm)
+dp.update.outer_middleware(MetricsMiddleware(metrics))
+# Профайлер по команде /profile; пока не запущен — ни потока, ни хуков
+profiler = SamplingProfiler()
+cleaner = PromptCleaner(bot)
+# База заявок общая для воркеров, доставляет их админу только воркер 0
+outbox = Outbox(
+    OUTBOX_DB_PATH, bot, YOUR_TELEGRAM_ID,
+    deliver=not WORKER_INDEX, poll_interval=1.0 if BOT_WORKERS > 1 else None,
+)
+# Все заявки в структурированном виде с полнотекстовым поиском для /find
+archive = ApplicationArchive(ARCHIVE_DB_PATH, APPLICATION_FIELDS)
+# Подсказки материалов из прошлых заявок; индекс в памяти догружается из архива
+suggestions = AnswerSuggestions(archive, SUGGEST_FIELDS)
 router = Router()
+startup_timer.mark("инициализация")
 
 # ——— /start ———
 @router.message(F.text == "/start")
 async def cmd_start(message: Message, state: FSMContext):
-    await state.clear()
-    sent = await message.answer(
-        "Здравствуйте\\! 👋\n\n"
-        "Я помогу вам оформить заявку на проектирование мебели\\.\n"
-        "Начнём с простого:\n\n"
-        "👤 *Ваше ФИО*\n"
-        "Пример: _Иванов Иван Иванович_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.fio)
-
-# ——— ОБРАБОТКА ФИО ———
-@router.message(Form.fio)
-async def process_fio(message: Message, state: FSMContext):
-    if not message.text:
-        await message.answer("Пожалуйста, введите текст\\. 📝")
+    if FORM_MODE == "single":
+        sent = await message.answer(render_form_card(STEPS[0], {}), reply_markup=await step_keyboard(0))
+    else:
+        sent = await message.answer(START_PROMPT.render())
+    # Сбрасываем прошлую анкету и встаём на первый шаг одной записью
+    await storage.set_state_and_data(state.key, STEPS[0].state, {"prev_bot_message_id": sent.message_id})
+
+# ——— ПОИСК ПО ЗАЯВКАМ (только для админа) ———
+class FindPage(CallbackData, prefix="find"):
+    search_id: int
+    page: int
+
+def search_keyboard(page: SearchPage) -> InlineKeyboardMarkup | None:
+    buttons = []
+    if page.page > 0:
+        buttons.append(InlineKeyboardButton(
+            text="◀️", callback_data=FindPage(search_id=page.search_id, page=page.page - 1).pack(),
+        ))
+    if page.page + 1 < page.pages:
+        buttons.append(InlineKeyboardButton(
+            text="▶️", callback_data=FindPage(search_id=page.search_id, page=page.page + 1).pack(),
+        ))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+# Регистрируется раньше шагов анкеты: /find посреди своей анкеты не считается ответом
+@router.message(Command("find"), F.from_user.id == YOUR_TELEGRAM_ID)
+async def cmd_find(message: Message, command: CommandObject):
+    page = await archive.search(command.args or "")
+    if page is None:
+        await message.answer(FIND_USAGE, parse_mode=None)
         return
-
-    fio = message.text.strip()
-    if not fio:
-        await message.answer("Пожалуйста, введите ваше ФИО\\. 📝")
+    await message.answer(render_search_page(page), reply_markup=search_keyboard(page))
+
+@router.callback_query(FindPage.filter(), F.from_user.id == YOUR_TELEGRAM_ID)
+async def find_page(callback: CallbackQuery, callback_data: FindPage):
+    page = await archive.search_by_id(callback_data.search_id, callback_data.page)
+    if page is not None:
+        await callback.message.edit_text(render_search_page(page), reply_markup=search_keyboard(page))
+    await callback.answer()
+
+# ——— ВЫГРУЗКА ЗАЯВОК (только для админа) ———
+@router.message(Command("export"), F.from_user.id == YOUR_TELEGRAM_ID)
+async def cmd_export(message: Message, command: CommandObject):
+    try:
+        request = parse_export_args(command.args)
+    except ValueError:
+        await message.answer(EXPORT_USAGE, parse_mode=None)
+        return
+    total, last_id = await archive.export_bounds(request.since, request.until, request.item_type)
+    if not total:
+        await message.answer(EXPORT_EMPTY, parse_mode=None)
+        return
+    # Файл собирается по ходу отправки; заявки, пришедшие за это время, в него не попадут
+    document = ApplicationExport(archive, EXPORT_COLUMNS, request, last_id)
+    # Лимит Telegram проверяем до отправки, а не после минут потоковой выгрузки
+    if not request.compress and await document.estimate_size(total) > UPLOAD_LIMIT:
+        request = request._replace(compress=True)
+        document = ApplicationExport(archive, EXPORT_COLUMNS, request, last_id)
+    if await document.estimate_size(total) > UPLOAD_LIMIT:
+        await message.answer(EXPORT_TOO_LARGE, parse_mode=None)
+        return
+    await message.answer_document(document, caption=export_caption(total, request.compress), parse_mode=None)
+
+# ——— ПРОФИЛИРОВАНИЕ (только для админа) ———
+PROFILE_DEFAULT_SECONDS = 30.0
+PROFILE_MAX_SECONDS = 300.0
+
+@router.message(Command("profile"), F.from_user.id == YOUR_TELEGRAM_ID)
+async def cmd_profile(message: Message, command: CommandObject):
+    try:
+        seconds = float(command.args) if command.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        seconds = 0.0
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        usage = PROFILE_USAGE.format(default=PROFILE_DEFAULT_SECONDS, limit=PROFILE_MAX_SECONDS)
+        await message.answer(usage, parse_mode=None)
+        return
+    if profiler.running:
+        await message.answer(PROFILE_BUSY, parse_mode=None)
         return
 
-    # Удаляем предыдущее сообщение бота (вопрос)
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except Exception:
-            pass
-
-    # ✅ Экранируем fio для безопасного использования в MarkdownV2
-    safe_fio = escape_markdown_v2(fio)
-
-    # ✅ Теперь можно безопасно подставить в сообщение
-    sent = await message.answer(
-        f"Отлично\\! Здравствуйте, {safe_fio}\\! ✨\n\n"
-        "📞 *Контактный телефон*\n"
-        "пример: _89991234567_"
-    )
-    
-    await state.update_data(fio=fio, prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.phone)
-# ——— ОБРАБОТКА ТЕЛЕФОНА ———
-@router.message(Form.phone)
-async def process_phone(message: Message, state: FSMContext):
-    # Получаем username или имя из аккаунта Telegram
-    telegram_username = message.from_user.username  # может быть None
-    telegram_first_name = message.from_user.first_name or ""
-    telegram_last_name = message.from_user.last_name or ""
-    
-    full_name = f"{telegram_first_name} {telegram_last_name}".strip()
-    contact_info = f"@{telegram_username}" if telegram_username else full_name
-
-    # Сохраняем контактные данные Telegram
-    await state.update_data(
-        telegram_contact=contact_info,
-        telegram_user_id=message.from_user.id
-    )
-
-    # Удаляем предыдущее сообщение бота
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    # Принимаем любой текст как "телефон" (или пропуск)
-    phone_input = message.text.strip() if message.text else ""
-    clean_phone = phone_input if phone_input else "—"
-
-    await state.update_data(phone=clean_phone)
-
-    sent = await message.answer(
-        "📝 *Изделие*\n"
-        "пример: _Шкаф Малиновая д15 кв25_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.item_type)
-
-# ——— ОБРАБОТКА НАИМЕНОВАНИЯ ИЗДЕЛИЯ ———
-@router.message(Form.item_type)
-async def process_item_type(message: Message, state: FSMContext):
-    item_name = message.text or ""
-
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    await state.update_data(item_type=item_name)
-
-    sent = await message.answer(
-        "📝 *Корпус*\n"
-        "пример: _16мм ЛДСП Платиновый белый гладкий W980 SM Egger_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.carcass_material)
-    
-# ——— ОБРАБОТКА МАТЕРИАЛА КОРПУСА ———
-@router.message(Form.carcass_material)
-async def process_carcass_material(message: Message, state: FSMContext):
-    material = message.text or ""
-
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    await state.update_data(carcass_material=material)
-
-    sent = await message.answer(
-        "📝 *Фасады*\n"
-        "пример: _Накладные 16мм ЛДСП Вишня Риверсайд Светлая K077 PW Kronospan_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.facade_material)
-
-# ——— ОБРАБОТКА МАТЕРИАЛА ФАСАДОВ ———
-@router.message(Form.facade_material)
-async def process_facade_material(message: Message, state: FSMContext):
-    facade = message.text or ""
-
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    await state.update_data(facade_material=facade)
-
-    sent = await message.answer(
-        "📝 *Видимые боковины*\n"
-        "пример: _16мм ЛДСП Дуб сонома светлый U103 ST9 Egger_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.visible_sides_material)
-
-# ——— ОБРАБОТКА МАТЕРИАЛА ВИДИМЫХ БОКОВИН ———
-@router.message(Form.visible_sides_material)
-async def process_visible_sides_material(message: Message, state: FSMContext):
-    visible_sides = message.text or ""
-
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    await state.update_data(visible_sides_material=visible_sides)
-
-    sent = await message.answer(
-        "📝 *Задняя стенка*\n"
-        "пример: _ХДФ 3мм в паз_ или _нет_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.back_wall)
-
-# ——— ОБРАБОТКА ЗАДНЕЙ СТЕНКИ ———
-@router.message(Form.back_wall)
-async def process_back_wall(message: Message, state: FSMContext):
-    back_wall = message.text or ""
-
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    await state.update_data(back_wall=back_wall)
-
-    sent = await message.answer(
-        "📝 *Столешница и панель*\n"
-        "пример: _Столешница 38мм, стеновая панель 6мм_ или _нет_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.countertop_and_wall_panel)
-
-# ——— ОБРАБОТКА ТОЛЩИНЫ СТОЛЕШНИЦЫ И СТЕНОВОЙ ПАНЕЛИ ———
-@router.message(Form.countertop_and_wall_panel)
-async def process_countertop_and_wall_panel(message: Message, state: FSMContext):
-    value = message.text or ""
-
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    await state.update_data(countertop_and_wall_panel=value)
-
-    sent = await message.answer(
-        "📝 *Козырёк*\n"
-        "пример: _60мм_ или _без козырька_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.canopy_height)
-
-# ——— ОБРАБОТКА ВЫСОТЫ КОЗЫРЬКА ———
-@router.message(Form.canopy_height)
-async def process_canopy_height(message: Message, state: FSMContext):
-    canopy = message.text or ""
-
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    await state.update_data(canopy_height=canopy)
-
-    sent = await message.answer(
-        "📝 *Цоколь*\n"
-        "пример: _60мм материал корпуса_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.plinth_height)
-
-# ——— ОБРАБОТКА ВЫСОТЫ ЦОКОЛЯ ———
-@router.message(Form.plinth_height)
-async def process_plinth_height(message: Message, state: FSMContext):
-    plinth = message.text or ""
-
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    await state.update_data(plinth_height=plinth)
-
-    sent = await message.answer(
-        "📝 *Кромка*\n"
-        "пример: _Корпус 1мм вкруг все детали, Фасады 2мм_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.edge_banding)
-
-# ——— ОБРАБОТКА КРОМКИ ———
-@router.message(Form.edge_banding)
-async def process_edge_banding(message: Message, state: FSMContext):
-    edge_info = message.text or ""
-
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    await state.update_data(edge_banding=edge_info)
-
-    sent = await message.answer(
-        "📝 *Дно и крышка*\n"
-        "пример: _Дно вкладное, крышка накладная_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.bottom_and_top_type)
-
-# ——— ОБРАБОТКА ВАРИАНТА ДНА И КРЫШКИ ———
-@router.message(Form.bottom_and_top_type)
-async def process_bottom_and_top_type(message: Message, state: FSMContext):
-    value = message.text or ""
-
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
+    async def send_profile(profile: Profile) -> None:
+        document = BufferedInputFile(profile.collapsed(), filename=f"profile-{int(time.time())}.collapsed")
+        caption = profile_caption(profile.samples, profile.samples * profile.interval, profile.seconds)
+        await bot.send_document(message.chat.id, document, caption=caption, parse_mode=None)
+
+    # Сэмплы собираются в фоне: обработчик не держит очередь апдейтов чата админа
+    profiler.start(seconds, send_profile)
+    await message.answer(profile_started(seconds), parse_mode=None)
+
+# ——— ПОДСКАЗКИ ОТВЕТОВ ———
+# Кнопка подставляет в поле ввода «@бот », дальше Telegram присылает inline-запросы
+# по мере набора (inline-режим должен быть включён в @BotFather: /setinline)
+SUGGEST_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[[
+    InlineKeyboardButton(text=SUGGEST_BUTTON, switch_inline_query_current_chat=""),
+]])
+
+async def inline_enabled() -> bool:
+    """Включён ли inline-режим: без него кнопка подсказок ничего не делает"""
+    try:
+        # bot.me() кеширует getMe — при старте его уже заполнил прогрев соединений
+        return bool((await bot.me()).supports_inline_queries)
+    except TelegramAPIError as e:
+        # Кеш остаётся пустым — спросим снова на следующем шаге
+        logger.warning("Не удалось узнать, включён ли inline-режим: %s", e)
+        return False
+
+async def suggest_keyboard(step: Step) -> InlineKeyboardMarkup | None:
+    return SUGGEST_KEYBOARD if step.suggest and await inline_enabled() else None
+
+@router.inline_query()
+async def suggest_answers(inline_query: InlineQuery, raw_state: str | None):
+    # Inline-запрос приходит без чата: состояние берётся по пользователю, то есть из его личного чата
+    step = STEP_BY_STATE.get(raw_state)
+    results = []
+    if step is not None and step.suggest:
+        await suggestions.refresh()
+        results = [
+            InlineQueryResultArticle(
+                id=str(number),
+                title=answer,
+                description=suggestion_description(count),
+                # Выбранный вариант уходит в чат обычным сообщением и принимается как ответ на шаг
+                input_message_content=InputTextMessageContent(message_text=answer, parse_mode=None),
+            )
+            for number, (answer, count) in enumerate(suggestions.suggest(step.key, inline_query.query))
+        ]
+    # Варианты зависят от шага анкеты, поэтому Telegram их не кеширует
+    await inline_query.answer(results, cache_time=0, is_personal=True)
+
+# ——— АНКЕТА ОДНИМ СООБЩЕНИЕМ (FORM_MODE=single) ———
+class FormButton(CallbackData, prefix="form"):
+    action: str      # back, skip или pick
+    step: int        # номер шага, на котором показана кнопка
+    choice: int = 0  # номер частого ответа для pick
+
+def form_keyboard(index: int, suggest: bool) -> InlineKeyboardMarkup | None:
+    step = STEPS[index]
+    rows = []
+    if step.choices:
+        rows.append([
+            InlineKeyboardButton(text=choice, callback_data=FormButton(action="pick", step=index, choice=i).pack())
+            for i, choice in enumerate(step.choices)
+        ])
+    navigation = []
+    if index:
+        navigation.append(InlineKeyboardButton(
+            text=BACK_BUTTON, callback_data=FormButton(action="back", step=index).pack(),
+        ))
+    if not step.required:
+        navigation.append(InlineKeyboardButton(
+            text=SKIP_BUTTON, callback_data=FormButton(action="skip", step=index).pack(),
+        ))
+    if navigation:
+        rows.append(navigation)
+    if step.suggest and suggest:
+        rows.extend(SUGGEST_KEYBOARD.inline_keyboard)
+    return InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+
+# Клавиатуры шагов не меняются — собираем при импорте, с кнопкой подсказок и без
+FORM_KEYBOARDS = {
+    suggest: [form_keyboard(index, suggest) for index in range(len(STEPS))] for suggest in (False, True)
+}
+
+async def step_keyboard(index: int) -> InlineKeyboardMarkup | None:
+    return FORM_KEYBOARDS[STEPS[index].suggest and await inline_enabled()][index]
+
+async def show_card(chat_id: int, data: dict, text: str, **kwargs) -> None:
+    """
+    Правит сообщение анкеты (его id — prev_bot_message_id). Если править нечего
+    (удалено пользователем, старше 48 часов), присылает новое и запоминает его id.
+    """
+    card_id = data.get("prev_bot_message_id")
+    if card_id:
         try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    await state.update_data(bottom_and_top_type=value)
-
-    sent = await message.answer(
-        "📝 *Технологические зазоры*\n"
-        "пример: _По бокам изделия 10мм суммарно, от потолка 15мм_"
+            await bot.edit_message_text(text=text, chat_id=chat_id, message_id=card_id, **kwargs)
+            return
+        except TelegramBadRequest as e:
+            # Тот же текст ещё раз (повтор той же ошибки ввода) — показывать нечего
+            if "message is not modified" in e.message:
+                return
+    sent = await bot.send_message(chat_id, text, **kwargs)
+    data["prev_bot_message_id"] = sent.message_id
+
+async def show_step(chat_id: int, step: Step, data: dict, error: str | None = None) -> None:
+    await show_card(
+        chat_id, data, render_form_card(step, data, error), reply_markup=await step_keyboard(STEP_INDEX[step.state.state]),
     )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.technical_gaps)
-
-# ——— ОБРАБОТКА ТЕХНИЧЕСКИХ ЗАЗОРОВ ———
-@router.message(Form.technical_gaps)
-async def process_technical_gaps(message: Message, state: FSMContext):
-    gaps = message.text or ""
 
+@router.callback_query(FormButton.filter(), StateFilter(Form))
+async def form_button(callback: CallbackQuery, callback_data: FormButton, state: FSMContext, raw_state: str):
+    await callback.answer()
+    step = STEP_BY_STATE[raw_state]
     data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    await state.update_data(technical_gaps=gaps)
-
-    sent = await message.answer(
-        "📝 *Петли*\n"
-        "пример: _Крестовые на евровинтах_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.hinges)
+    # Кнопки прошлого шага или прошлой анкеты (двойное нажатие, старое сообщение) ничего не делают
+    if callback_data.step != STEP_INDEX[raw_state] or callback.message.message_id != data.get("prev_bot_message_id"):
+        return
 
-# ——— ОБРАБОТКА ПЕТЛЕЙ ———
-@router.message(Form.hinges)
-async def process_hinges(message: Message, state: FSMContext):
-    hinges_info = message.text or ""
+    if callback_data.action == "back":
+        prev_step = PREV_STEP[raw_state]
+        if prev_step is not None:
+            await show_step(callback.message.chat.id, prev_step, data)
+            await storage.set_state_and_data(state.key, prev_step.state, data)
+        return
+    if callback_data.action == "pick" and callback_data.choice < len(step.choices):
+        value = step.choices[callback_data.choice]
+    elif callback_data.action == "skip" and not step.required:
+        value = "—"
+    else:
+        return
 
+    data[step.key] = value
+    if step.extra:
+        data.update(step.extra(callback.from_user))
+    await next_question(callback.message, state, raw_state, data)
+
+@router.callback_query(FormButton.filter())
+async def stale_form_button(callback: CallbackQuery):
+    # Анкета уже отправлена или сброшена — просто убираем «часики» на кнопке
+    await callback.answer()
+
+# ——— ВЛОЖЕНИЯ (эскизы, фото, PDF) ———
+# Регистрируется раньше шагов анкеты: файл на любом шаге — приложение к заявке, а не ответ.
+# Храним только file_id, сами файлы бот не скачивает; админу они уйдут альбомами вместе с заявкой
+@router.message(StateFilter(Form), F.photo | F.video | F.document)
+async def receive_attachment(message: Message, state: FSMContext, raw_state: str):
+    step = STEP_BY_STATE[raw_state]
     data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    await state.update_data(hinges=hinges_info)
-
-    sent = await message.answer(
-        "📝 *Опоры*\n"
-        "пример: _Кухонные 60мм_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.supports)
-
-# ——— ОБРАБОТКА ОПОР ———
-@router.message(Form.supports)
-async def process_supports(message: Message, state: FSMContext):
-    supports_info = message.text or ""
+    attachments = data.get("attachments") or []
+    if len(attachments) >= MAX_ATTACHMENTS:
+        # О пределе уже сказали — лишние файлы не стоят ни памяти, ни вызовов Bot API
+        return
+    data["attachments"] = [*attachments, extract_attachment(message)]
+
+    # Альбом приходит отдельным апдейтом на каждый файл, а апдейты чата обрабатываются
+    # по порядку — подтверждаем только первый файл альбома, остальные просто дописываем
+    album = message.media_group_id
+    if album is None or album != data.get("media_group_id"):
+        data["media_group_id"] = album
+        note = attachments_note(len(data["attachments"]))
+        if FORM_MODE == "single":
+            await show_step(message.chat.id, step, data)
+        else:
+            # Вопрос повторяем вместе с подтверждением, старый удалит фоновая очистка
+            prev_id = data.get("prev_bot_message_id")
+            if prev_id:
+                cleaner.schedule(message.chat.id, prev_id)
+            sent = await message.answer(
+                f"{note}\n\n{PROMPTS[step.state.state].render(data)}",
+                reply_markup=await suggest_keyboard(step),
+            )
+            data["prev_bot_message_id"] = sent.message_id
+    await storage.set_state_and_data(state.key, step.state, data)
+
+# ——— ОБРАБОТКА ШАГОВ АНКЕТЫ ———
+@router.message(StateFilter(Form))
+async def process_step(message: Message, state: FSMContext, raw_state: str):
+    step = STEP_BY_STATE[raw_state]
+    try:
+        value = step.parse(message)
+    except InvalidAnswer as e:
+        if FORM_MODE == "single":
+            # Причину показываем в том же сообщении над вопросом
+            data = await state.get_data()
+            await show_step(message.chat.id, step, data, error=str(e))
+            await storage.set_state_and_data(state.key, step.state, data)
+        else:
+            await message.answer(str(e))
+        return
 
     data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
+    data[step.key] = value
+    if step.extra:
+        data.update(step.extra(message.from_user))
+    await next_question(message, state, raw_state, data)
+
+async def next_question(message: Message, state: FSMContext, raw_state: str, data: dict):
+    """Следующий вопрос (или финализация) после принятого ответа — текстом или кнопкой"""
+    next_step = NEXT_STEP[raw_state]
+    if FORM_MODE == "single":
+        if next_step is None:
+            await finalize_application(message, state, data)
+            return
+        # Тот же запрос к Bot API, что и новый вопрос, но удалять потом нечего
+        await show_step(message.chat.id, next_step, data)
+    else:
+        # Предыдущий вопрос удалит фоновая очистка, ответ пользователю не ждёт Bot API
+        prev_id = data.get("prev_bot_message_id")
+        if prev_id:
+            cleaner.schedule(message.chat.id, prev_id)
+        if next_step is None:
+            await finalize_application(message, state, data)
+            return
+        sent = await message.answer(
+            PROMPTS[next_step.state.state].render(data), reply_markup=await suggest_keyboard(next_step),
+        )
+        data["prev_bot_message_id"] = sent.message_id
+
+    # Ответ, id нового вопроса и следующее состояние — одной записью в хранилище
+    await storage.set_state_and_data(state.key, next_step.state, data)
 
-    await state.update_data(supports=supports_info)
-
-    sent = await message.answer(
-        "📝 *Ящики*\n"
-        "пример: _Дерев ящ на напр скрыт монт с доводчиком Firmax_"
-    )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.drawers)
+# ——— ФИНАЛИЗАЦИЯ ———
+async def finalize_application(message: Message, state: FSMContext, data: dict):
+    text = ADMIN_SUMMARY.render(data)
+    attachments = data.get("attachments") or ()
+    if attachments:
+        text += summary_attachments_line(len(attachments))
+    # Заявка сначала ложится в журнал на диске, доставка админу — в фоне
+    key = f"{message.chat.id}:{message.message_id}"
+    await outbox.append(key, text, attachments)
+    metrics.application_completed()
 
-# ——— ОБРАБОТКА ЯЩИКОВ ———
-@router.message(Form.drawers)
-async def process_drawers(message: Message, state: FSMContext):
-    drawers_info = message.text or ""
+    await state.clear()
+    if FORM_MODE == "single":
+        # Сообщение анкеты становится итоговым, кнопки с него убираются
+        await show_card(message.chat.id, data, DONE_MESSAGE, parse_mode=None)
+    else:
+        await message.answer(DONE_MESSAGE, parse_mode=None)
+        # Вопросы анкеты больше не нужны — удаляем всё разом
+        cleaner.flush_chat(message.chat.id)
+
+    # Архив и подсказки — уже после ответа: клиент не ждёт вставку в индекс
+    try:
+        await archive.add(key, message.chat.id, data)
+    except Exception:
+        # Заявка уже в outbox и дойдёт до админа; без архива её не найдёт только /find
+        logger.exception("Не удалось сохранить заявку %s в архив", key)
+    else:
+        # Ответы этой заявки сразу попадают в подсказки следующим клиентам
+        await suggestions.refresh(force=True)
+
+# ——— AIOHTTP-ПРИЛОЖЕНИЕ ———
+WEBHOOK_PATH = "/webhook"
+
+async def on_startup():
+    # Доставляем заявки, не успевшие уйти админу до рестарта
+    outbox.start()
+    suggestions.start()
+
+def build_app() -> web.Application:
+    """Собирает веб-приложение бота: health check и webhook (используется и в нагрузочном тесте)"""
+    dp.include_router(router)
+    dp.startup.register(on_startup)
+    # При остановке дочищаем вопросы и дописываем в базу очередь записи
+    dp.shutdown.register(cleaner.close)
+    dp.shutdown.register(outbox.close)
+    dp.shutdown.register(scheduler.close)
+    dp.shutdown.register(suggestions.close)
+    dp.shutdown.register(profiler.close)
+    dp.shutdown.register(storage.close)
+    dp.shutdown.register(archive.close)
+    # Сессию — последней: хуки выше ещё отправляют сообщения и удаляют вопросы
+    dp.shutdown.register(bot.session.close)
 
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
+    # Создаём aiohttp-приложение
+    app = web.Application()
 
-    await state.update_data(drawers=drawers_info)
+    # Добавляем health check на корень
+    async def health_check(request):
+        return web.Response(text="OK", status=200)
+    app.router.add_get('/', health_check)
 
-    sent = await message.answer(
-        "📝 *Дополнительное описание*\n"
-        "Особенности, пожелания, примечания\n\n"
-        "Если нет, напишите _нет_"
+    # Регистрируем webhook-обработчик: Telegram получает 200 сразу, апдейты — в очередь.
+    # За фронтовым процессом дубли уже отсечены, там их и считают
+    webhook_handler = QueuedRequestHandler(
+        dispatcher=dp, bot=bot, workers=WEBHOOK_WORKERS, max_queue=WEBHOOK_QUEUE_SIZE, secret_token=WEBHOOK_SECRET,
+        deduplicator=UpdateDeduplicator(path=UPDATE_HWM_PATH) if WORKER_INDEX is None else None,
+        merge_window=FLOOD_MERGE_WINDOW,
     )
-    await state.update_data(prev_bot_message_id=sent.message_id)
-    await state.set_state(Form.additional_info)
-
-# ——— ОБРАБОТКА ДОПОЛНИТЕЛЬНОГО ОПИСАНИЯ ———
-@router.message(Form.additional_info)
-async def process_additional_info(message: Message, state: FSMContext):
-    data = await state.get_data()
-    prev_id = data.get("prev_bot_message_id")
-    if prev_id:
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=prev_id)
-        except:
-            pass
-
-    # Сохраняем только текст
-    description = message.text if message.text else "—"
-    await state.update_data(additional_description=description)
+    webhook_handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
 
-    # Сразу финализируем
-    await finalize_application(message, state)
+    # Метрики для Prometheus; значения компонентов собираются только при скрейпе
+    async def collect_runtime_stats() -> dict[str, float]:
+        active, abandoned = await storage.session_counts(SESSION_ABANDON_AFTER)
+        send_stats = scheduler.stats()
+        stats = {
+            "mebel_sessions_active": active,
+            "mebel_sessions_abandoned": abandoned,
+            "mebel_sessions_expired_total": storage.expired,
+            "mebel_webhook_queue_depth": webhook_handler.queued,
+            "mebel_webhook_rejected_total": webhook_handler.rejected,
+            "mebel_send_queue_depth": send_stats["queue_depth"],
+            "mebel_send_wait_seconds_avg": send_stats["avg_wait"],
+            "mebel_send_retry_after_total": send_stats["retry_after"],
+            "mebel_outbox_pending": await outbox.pending_count(),
+            "mebel_archive_applications": await archive.count(),
+            "mebel_slow_updates_total": tracer.slow,
+            "mebel_flood_users_tracked": flood.tracked_users(),
+        }
+        if webhook_handler.deduplicator is not None:
+            stats["mebel_webhook_duplicates_total"] = webhook_handler.deduplicator.dropped
+        for reason, count in flood.shed.items():
+            stats[f'mebel_flood_shed_total{{reason="{reason}"}}'] = count
+        stats['mebel_flood_shed_total{reason="merged"}'] = webhook_handler.merged
+        for op, count in storage.ops.items():
+            stats[f'mebel_storage_ops_total{{op="{op}"}}'] = count
+        return stats
+    metrics.add_collector(collect_runtime_stats)
+    app.router.add_get('/metrics', metrics.handle)
+    return app
+
+def build_front_app(pool: WorkerPool) -> web.Application:
+    """Фронтовое приложение: health check, webhook с раздачей апдейтов по воркерам и их общие метрики"""
+    app = web.Application()
 
-# ——— ФИНАЛИЗАЦИЯ ———
-async def finalize_application(message: Message, state: FSMContext):
-    data = await state.get_data()
-    text = (
-        "📩 Новая заявка на проектирование мебели\n\n"
-        f"ФИО: {data.get('fio', '—')}\n"
-        f"Telegram: {data.get('telegram_contact', '—')}\n"
-        f"Телефон: {data.get('phone', '—')}\n"
-        f"Изделие: {data.get('item_type', '—')}\n\n"
-        f"Корпус: {data.get('carcass_material', '—')}\n"
-        f"Фасады: {data.get('facade_material', '—')}\n"
-        f"Видимые боковины: {data.get('visible_sides_material', '—')}\n"
-        f"Задняя стенка: {data.get('back_wall', '—')}\n"
-        f"Столешница / панель: {data.get('countertop_and_wall_panel', '—')}\n"
-        f"Козырёк: {data.get('canopy_height', '—')}\n"
-        f"Цоколь: {data.get('plinth_height', '—')}\n"
-        f"Кромка: {data.get('edge_banding', '—')}\n"
-        f"Дно / крышка: {data.get('bottom_and_top_type', '—')}\n"
-        f"Тех. зазоры: {data.get('technical_gaps', '—')}\n"
-        f"Петли: {data.get('hinges', '—')}\n"
-        f"Опоры: {data.get('supports', '—')}\n"
-        f"Ящики: {data.get('drawers', '—')}\n"
-        f"Доп. описание: {data.get('additional_description', '—')}"
-    )
-    await bot.send_message(chat_id=YOUR_TELEGRAM_ID, text=text, parse_mode=None)
+    async def health_check(request):
+        return web.Response(text="OK", status=200)
+    app.router.add_get('/', health_check)
 
-    await state.clear()
-    await message.answer(
-        "Заявка отправлена! 🎉\n\n"
-        "Мы создадим в Telegram персональную группу для данного проекта и добавим в неё вас. "
-        "Там можно будет обсуждать детали и обмениваться файлами.\n\n"
-        "Хорошего дня! 👍\n\n"
-        "Для новой заявки отправьте /start",
-        parse_mode=None
+    chat_router = ChatRouter(
+        pool.ports, WEBHOOK_PATH, deduplicator=UpdateDeduplicator(path=UPDATE_HWM_PATH), secret_token=WEBHOOK_SECRET,
     )
+    chat_router.register(app)
+    app.router.add_get('/metrics', chat_router.handle_metrics)
+    return app
 
-import os
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
-from aiohttp import web
+async def serve(app: web.Application, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    return runner
+
+def stop_event() -> asyncio.Event:
+    # Render останавливает сервис через SIGTERM — закрываемся штатно
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    return stop
+
+async def run_worker():
+    # Воркер слушает только localhost; webhook регистрирует фронтовой процесс
+    stop = stop_event()
+    app = build_app()
+    startup_timer.mark("приложение")
+    await session.warm_up(bot, BOT_API_WARM_CONNECTIONS)
+    startup_timer.mark("прогрев Bot API")
+    runner = await serve(app, "127.0.0.1", int(os.environ[WORKER_PORT_ENV]))
+    startup_timer.mark("сайт")
+    startup_timer.log(f"Воркер {WORKER_INDEX} запущен")
+    try:
+        await watch_parent(stop)
+    finally:
+        await runner.cleanup()
 
 # ——— ОСНОВНОЙ ЗАПУСК НА RENDER ———
 async def main():
-    dp.include_router(router)
-    await bot.delete_webhook(drop_pending_updates=True)
+    if WORKER_INDEX is not None:
+        await run_worker()
+        return
 
     # Render даёт порт через env-переменную
     PORT = int(os.getenv("PORT", "10000"))
     service_name = os.getenv("RENDER_SERVICE_NAME", "mebel-bot")
-    WEBHOOK_PATH = "/webhook"
     WEBHOOK_URL = f"https://{service_name}.onrender.com{WEBHOOK_PATH}"
 
     print(f"ℹ️  Webhook URL: {WEBHOOK_URL}")
 
-    # Создаём aiohttp-приложение
-    app = web.Application()
-
-    # Добавляем health check на корень
-    async def health_check(request):
-        return web.Response(text="OK", status=200)
-    app.router.add_get('/', health_check)
-
-    # Регистрируем webhook-обработчик
-    SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path=WEBHOOK_PATH)
-    setup_application(app, dp, bot=bot)
-
-    # Запускаем сервер
-    runner = web.AppRunner(app)
-    await runner.setup()
-    site = web.TCPSite(runner, host="0.0.0.0", port=PORT)
-    await site.start()
-
-    # Устанавливаем webhook ПОСЛЕ запуска сервера
-    await bot.set_webhook(url=WEBHOOK_URL)
-
-    print("✅ Webhook установлен. Сервер запущен.")
-    await asyncio.Event().wait()
+    stop = stop_event()
+    pool = None
+    if BOT_WORKERS > 1:
+        # Каждый воркер — отдельный процесс со своим event loop; чат всегда попадает в один и тот же
+        pool = WorkerPool(BOT_WORKERS, WORKER_BASE_PORT, argv=[sys.executable, os.path.abspath(__file__)])
+        app = build_front_app(pool)
+    else:
+        app = build_app()
+    startup_timer.mark("приложение")
+
+    # Сервер поднимаем сразу: health check Render отвечает, пока идут вызовы Bot API.
+    # Апдейты, пришедшие раньше готовности воркеров, получат 503 и будут повторены
+    runner = await serve(app, "0.0.0.0", PORT)
+    startup_timer.mark("сайт")
+
+    try:
+        if pool is not None:
+            await pool.start()
+            startup_timer.mark("воркеры")
+        # Соединения с Bot API открываем параллельно с проверкой webhook — первый
+        # пользователь не ждёт TLS. Накопившиеся за деплой апдейты не сбрасываем
+        await asyncio.gather(
+            session.warm_up(bot, BOT_API_WARM_CONNECTIONS if pool is None else 1),
+            ensure_webhook(bot, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_STATE_PATH),
+        )
+        startup_timer.mark("прогрев и webhook")
+        startup_timer.log("Бот запущен")
+
+        print("✅ Webhook установлен. Сервер запущен.")
+        await stop.wait()
+    finally:
+        # Сначала перестаём принимать апдейты, потом даём воркерам дообработать свои очереди
+        await runner.cleanup()
+        if pool is not None:
+            await pool.stop()
+            await bot.session.close()
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
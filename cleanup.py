@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Bot API на один вызов deleteMessages
+DELETE_BATCH_SIZE = 100
+
+
+class PromptCleaner:
+    """
+    Фоновое удаление устаревших вопросов бота.
+
+    Обработчики только ставят id сообщения в очередь своего чата и сразу отвечают
+    пользователю; очередь разбирается пачками через deleteMessages — по таймеру
+    или явным `flush_chat` в конце анкеты. `flush_chat` тоже не ждёт удаления:
+    deleteMessages идёт с низшим приоритетом, за всеми ответами пользователям.
+    """
+
+    def __init__(self, bot: Bot, flush_interval: float = 1.0, max_retries: int = 3):
+        self.bot = bot
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._pending: defaultdict[int, list[int]] = defaultdict(list)
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def schedule(self, chat_id: int, message_id: int) -> None:
+        self._pending[chat_id].append(message_id)
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    def flush_chat(self, chat_id: int) -> None:
+        """Удаляет вопросы чата сейчас же, не дожидаясь таймера, — в фоне"""
+        message_ids = self._pending.pop(chat_id, None)
+        if message_ids:
+            task = asyncio.create_task(self._delete(chat_id, message_ids))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def flush(self) -> None:
+        pending, self._pending = self._pending, defaultdict(list)
+        await asyncio.gather(*(self._delete(chat_id, ids) for chat_id, ids in pending.items()))
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def _delete(self, chat_id: int, message_ids: list[int]) -> None:
+        for i in range(0, len(message_ids), DELETE_BATCH_SIZE):
+            batch = message_ids[i:i + DELETE_BATCH_SIZE]
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await self.bot.delete_messages(chat_id=chat_id, message_ids=batch)
+                    break
+                except TelegramRetryAfter as e:
+                    if attempt == self.max_retries:
+                        logger.warning("Не удалось удалить %d сообщений в чате %s: %s", len(batch), chat_id, e)
+                        break
+                    await asyncio.sleep(e.retry_after)
+                except TelegramAPIError as e:
+                    # Например, сообщение старше 48 часов — повторять бессмысленно
+                    logger.warning("Не удалось удалить %d сообщений в чате %s: %s", len(batch), chat_id, e)
+                    break
@@ -0,0 +1,282 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import secrets
+import signal
+from typing import Any, Sequence
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector, web
+
+from webhook import UpdateDeduplicator, update_chat_key
+
+logger = logging.getLogger(__name__)
+
+# Переменные окружения, по которым процесс узнаёт, что он воркер
+WORKER_INDEX_ENV = "BOT_WORKER_INDEX"
+WORKER_PORT_ENV = "BOT_WORKER_PORT"
+
+
+class HashRing:
+    """
+    Консистентное хеширование чатов по воркерам.
+
+    У каждого воркера `replicas` точек на кольце, чат достаётся ближайшей точке
+    по часовой стрелке. При изменении числа воркеров переезжает только ~1/N чатов,
+    остальные сессии остаются в кэше своего процесса.
+    """
+
+    def __init__(self, nodes: int, replicas: int = 64):
+        points = sorted((self._hash(f"{node}:{replica}"), node) for node in range(nodes) for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def node_for(self, key: Any) -> int:
+        index = bisect.bisect(self._hashes, self._hash(str(key)))
+        return self._nodes[index % len(self._nodes)]
+
+
+class WorkerPool:
+    """
+    Дочерние процессы-воркеры: каждый — обычный бот с собственным event loop,
+    слушающий `127.0.0.1:base_port + index`.
+
+    Упавший воркер перезапускается; `stop` шлёт всем SIGTERM и ждёт, пока они
+    дообработают очереди и сбросят хранилище, а не успевших — добивает.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        base_port: int,
+        argv: Sequence[str],
+        start_timeout: float = 30.0,
+        stop_timeout: float = 20.0,
+        restart_delay: float = 1.0,
+    ):
+        self.ports = [base_port + index for index in range(count)]
+        self.argv = list(argv)
+        self.start_timeout = start_timeout
+        self.stop_timeout = stop_timeout
+        self.restart_delay = restart_delay
+        self.restarts = 0
+        self._processes: list[asyncio.subprocess.Process | None] = [None] * count
+        self._supervisors: list[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self) -> None:
+        """Запускает всех воркеров и возвращается, когда каждый отвечает на health check"""
+        await asyncio.gather(*(self._spawn(index) for index in range(len(self.ports))))
+        self._supervisors = [asyncio.create_task(self._supervise(index)) for index in range(len(self.ports))]
+
+    async def _spawn(self, index: int) -> None:
+        env = {**os.environ, WORKER_INDEX_ENV: str(index), WORKER_PORT_ENV: str(self.ports[index])}
+        process = await asyncio.create_subprocess_exec(*self.argv, env=env)
+        self._processes[index] = process
+        await self._wait_ready(index, process)
+        logger.info("Воркер %d запущен (pid %d, порт %d)", index, process.pid, self.ports[index])
+
+    async def _wait_ready(self, index: int, process: asyncio.subprocess.Process) -> None:
+        url = f"http://127.0.0.1:{self.ports[index]}/"
+        deadline = asyncio.get_running_loop().time() + self.start_timeout
+        async with ClientSession(timeout=ClientTimeout(total=1)) as http:
+            while True:
+                if process.returncode is not None:
+                    raise RuntimeError(f"Воркер {index} завершился при запуске с кодом {process.returncode}")
+                try:
+                    async with http.get(url) as response:
+                        if response.status == 200:
+                            return
+                except (ClientError, asyncio.TimeoutError):
+                    pass
+                if asyncio.get_running_loop().time() > deadline:
+                    raise RuntimeError(f"Воркер {index} не ответил за {self.start_timeout:.0f} с")
+                await asyncio.sleep(0.05)
+
+    async def _supervise(self, index: int) -> None:
+        while True:
+            code = await self._processes[index].wait()
+            if self._stopping:
+                return
+            self.restarts += 1
+            logger.error("Воркер %d завершился с кодом %s, перезапуск", index, code)
+            await asyncio.sleep(self.restart_delay)
+            try:
+                await self._spawn(index)
+            except Exception:
+                logger.exception("Не удалось перезапустить воркер %d", index)
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for supervisor in self._supervisors:
+            supervisor.cancel()
+        running = [process for process in self._processes if process is not None and process.returncode is None]
+        for process in running:
+            process.send_signal(signal.SIGTERM)
+        if not running:
+            return
+        _, pending = await asyncio.wait([asyncio.create_task(process.wait()) for process in running], timeout=self.stop_timeout)
+        if pending:
+            logger.warning("%d воркеров не завершились за %.0f с, принудительная остановка", len(pending), self.stop_timeout)
+            for process in running:
+                if process.returncode is None:
+                    process.kill()
+            await asyncio.wait(pending)
+
+
+async def watch_parent(stop: asyncio.Event, interval: float = 1.0) -> None:
+    """Для воркера: ждёт `stop` или смерти фронтового процесса, не успевшего прислать SIGTERM"""
+    parent = os.getppid()
+    while True:
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+            return
+        except asyncio.TimeoutError:
+            if os.getppid() != parent:
+                logger.warning("Фронтовой процесс %d пропал, воркер останавливается", parent)
+                return
+
+
+class ChatRouter:
+    """
+    Фронтовой webhook: принимает апдейты от Telegram и пересылает каждый воркеру,
+    за которым по `HashRing` закреплён его чат, — так сессия анкеты живёт в одном
+    процессе, а апдейты одного чата уходят туда строго по очереди.
+
+    Ответ воркера (200 сразу после постановки в очередь или 503 при переполнении)
+    возвращается Telegram как есть. Повторные доставки отсекаются здесь, до пересылки;
+    если переслать не удалось, апдейт забывается, чтобы повтор Telegram не сочли дублем.
+    """
+
+    SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+    def __init__(
+        self,
+        ports: Sequence[int],
+        path: str,
+        deduplicator: UpdateDeduplicator | None = None,
+        secret_token: str | None = None,
+        timeout: float = 10.0,
+    ):
+        self.bases = [f"http://127.0.0.1:{port}" for port in ports]
+        self.path = path
+        self.ring = HashRing(len(ports))
+        self.deduplicator = deduplicator
+        self.secret_token = secret_token
+        self.timeout = timeout
+        self._http: ClientSession | None = None
+        # Последняя пересылка по каждому чату — следующая ждёт её завершения
+        self._tails: dict[Any, asyncio.Future] = {}
+        self.forwarded = [0] * len(ports)
+        self.rejected = 0
+        self.failed = 0
+
+    def register(self, app: web.Application) -> None:
+        app.router.add_post(self.path, self.handle)
+        # on_cleanup вызывается после того, как aiohttp дождался текущих пересылок
+        app.on_cleanup.append(self._close)
+
+    def _client(self) -> ClientSession:
+        if self._http is None:
+            self._http = ClientSession(connector=TCPConnector(limit=0), timeout=ClientTimeout(total=self.timeout))
+        return self._http
+
+    async def handle(self, request: web.Request) -> web.Response:
+        secret = request.headers.get(self.SECRET_HEADER)
+        # Чужие запросы отсекаем до дедупликатора, чтобы они не занимали в нём update_id
+        if self.secret_token and not secrets.compare_digest(secret or "", self.secret_token):
+            return web.Response(body="Unauthorized", status=401)
+        body = await request.read()
+        update = json.loads(body)
+        update_id = update["update_id"]
+        if self.deduplicator is not None and self.deduplicator.seen(update_id):
+            return web.json_response({})
+
+        chat_key = update_chat_key(update)
+        previous = self._tails.get(chat_key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[chat_key] = done
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            response = await self._forward(self.ring.node_for(chat_key), body, secret)
+        finally:
+            done.set_result(None)
+            if self._tails.get(chat_key) is done:
+                del self._tails[chat_key]
+
+        if response.status != 200 and self.deduplicator is not None:
+            self.deduplicator.forget(update_id)
+        return response
+
+    async def _forward(self, worker: int, body: bytes, secret: str | None) -> web.Response:
+        headers = {"Content-Type": "application/json"}
+        if secret is not None:
+            headers[self.SECRET_HEADER] = secret
+        try:
+            async with self._client().post(self.bases[worker] + self.path, data=body, headers=headers) as response:
+                if response.status == 503:
+                    self.rejected += 1
+                    return web.Response(status=503, headers={"Retry-After": response.headers.get("Retry-After", "1")})
+                payload = await response.read()
+                self.forwarded[worker] += 1
+                return web.Response(status=response.status, body=payload, content_type="application/json")
+        except (ClientError, asyncio.TimeoutError) as e:
+            self.failed += 1
+            logger.warning("Воркер %d недоступен: %r", worker, e)
+            return web.Response(status=503, headers={"Retry-After": "1"})
+
+    async def _close(self, app: web.Application) -> None:
+        if self.deduplicator is not None:
+            self.deduplicator.save()
+        if self._http is not None:
+            await self._http.close()
+
+    # ——— МЕТРИКИ ———
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """Метрики всех воркеров с меткой worker="N" плюс счётчики самого фронта"""
+        lines = []
+        typed = set()
+        bodies = await asyncio.gather(*(self._fetch_metrics(base) for base in self.bases))
+        for worker, body in enumerate(bodies):
+            label = f'worker="{worker}"'
+            for line in body.splitlines():
+                if line.startswith("# TYPE "):
+                    if line not in typed:
+                        typed.add(line)
+                        lines.append(line)
+                elif line and not line.startswith("#"):
+                    lines.append(_add_label(line, label))
+
+        lines.append("# TYPE mebel_router_forwarded_total counter")
+        for worker, count in enumerate(self.forwarded):
+            lines.append(f'mebel_router_forwarded_total{{worker="{worker}"}} {count}')
+        lines.append("# TYPE mebel_router_rejected_total counter")
+        lines.append(f"mebel_router_rejected_total {self.rejected}")
+        lines.append("# TYPE mebel_router_failed_total counter")
+        lines.append(f"mebel_router_failed_total {self.failed}")
+        if self.deduplicator is not None:
+            lines.append("# TYPE mebel_webhook_duplicates_total counter")
+            lines.append(f"mebel_webhook_duplicates_total {self.deduplicator.dropped}")
+        return web.Response(text="\n".join(lines) + "\n", content_type="text/plain", charset="utf-8")
+
+    async def _fetch_metrics(self, base: str) -> str:
+        try:
+            async with self._client().get(f"{base}/metrics") as response:
+                return await response.text()
+        except (ClientError, asyncio.TimeoutError):
+            # Перезапускающийся воркер просто выпадает из одного скрейпа
+            return ""
+
+
+def _add_label(line: str, label: str) -> str:
+    name, _, value = line.rpartition(" ")
+    if name.endswith("}"):
+        return f"{name[:-1]},{label}}} {value}"
+    return f"{name}{{{label}}} {value}"
@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, AsyncGenerator, NamedTuple, Sequence
+
+from aiogram import Bot
+from aiogram.types import InputFile
+
+from archive import ApplicationArchive
+
+EXPORT_FORMATS = ("csv", "jsonl")
+# Telegram принимает от ботов файлы до 50 МБ; запас — на неточность оценки размера
+UPLOAD_LIMIT = 45 * 1000 * 1000
+_DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y")
+
+
+class ExportRequest(NamedTuple):
+    format: str = "csv"
+    compress: bool = False
+    since: float | None = None      # unix-время, включительно
+    until: float | None = None      # unix-время, не включая
+    item_type: str | None = None    # слова, которые должны быть в поле «Изделие»
+
+
+def _parse_date(token: str) -> datetime | None:
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(token, date_format)
+        except ValueError:
+            pass
+    return None
+
+
+def parse_export_args(args: str | None) -> ExportRequest:
+    """
+    Аргументы /export в любом порядке: формат (csv/jsonl), «gz», до двух дат
+    (с какой и по какую включительно, локальное время) и слова для фильтра по
+    изделию. Больше двух дат или даты не по порядку — ValueError.
+    """
+    export_format, compress, dates, words = "csv", False, [], []
+    for token in (args or "").split():
+        lowered = token.lower()
+        if lowered in EXPORT_FORMATS:
+            export_format = lowered
+        elif lowered == "gz":
+            compress = True
+        elif (date := _parse_date(token)) is not None:
+            dates.append(date)
+        else:
+            words.append(token)
+    if len(dates) > 2:
+        raise ValueError("Больше двух дат")
+    since = dates[0].timestamp() if dates else None
+    until = (dates[1] + timedelta(days=1)).timestamp() if len(dates) == 2 else None
+    if since is not None and until is not None and since >= until:
+        raise ValueError("Начальная дата позже конечной")
+    return ExportRequest(export_format, compress, since, until, " ".join(words) or None)
+
+
+class ApplicationExport(InputFile):
+    """
+    Выгрузка архива заявок как документ Telegram, сформированный на лету.
+
+    Строки читаются из архива пачками и кодируются в CSV или JSONL по мере
+    отправки: aiohttp шлёт файл chunked-запросом, так что ни вся история, ни
+    готовый файл целиком не лежат ни в памяти, ни на диске. Каждый вызов `read`
+    начинает выгрузку заново — повтор запроса после 429 отправит тот же файл.
+    Столбцы — пары (ключ, подпись): в CSV заголовок из подписей, в JSONL ключи.
+
+    Размер файла заранее неизвестен, и Telegram отвергнет слишком большой только
+    в конце отправки; `estimate_size` оценивает его по первым строкам выгрузки.
+    """
+
+    def __init__(
+        self,
+        archive: ApplicationArchive,
+        columns: Sequence[tuple[str, str]],
+        request: ExportRequest,
+        last_id: int,
+        chunk_size: int = 64 * 1024,
+    ):
+        extension = request.format + (".gz" if request.compress else "")
+        super().__init__(filename=f"applications-{datetime.now():%Y-%m-%d}.{extension}", chunk_size=chunk_size)
+        self.archive = archive
+        self.keys = [key for key, _ in columns]
+        self.labels = [label for _, label in columns]
+        self.request = request
+        self.last_id = last_id
+        self.rows = 0
+
+    def _format(self, key: str, value: Any) -> Any:
+        if key == "created_at" and value is not None:
+            return datetime.fromtimestamp(value).isoformat(" ", "seconds")
+        return value
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        async for chunk in self._encode():
+            yield chunk
+
+    async def estimate_size(self, total: int, sample: int = 500) -> int:
+        """Оценка размера файла из `total` строк по первым `sample`, в том же формате и сжатии"""
+        size = 0
+        async for chunk in self._encode(limit=sample):
+            size += len(chunk)
+        # Маленькая выборка сжимается хуже целого файла, так что оценка сжатого — с запасом
+        return size * total // max(self.rows, 1)
+
+    async def _encode(self, limit: int | None = None) -> AsyncGenerator[bytes, None]:
+        request = self.request
+        compressor = zlib.compressobj(wbits=31) if request.compress else None   # wbits=31 — формат gzip
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if request.format == "csv" else None
+        if writer is not None:
+            # BOM — чтобы Excel открыл кириллицу в UTF-8 без мастера импорта
+            buffer.write("\ufeff")
+            writer.writerow(self.labels)
+
+        def drain() -> bytes:
+            data = buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            return compressor.compress(data) if compressor is not None else data
+
+        self.rows = 0
+        rows = self.archive.iter_export(
+            self.keys, self.last_id, request.since, request.until, request.item_type,
+            batch_size=min(limit or 1000, 1000),
+        )
+        async for row in rows:
+            values = [self._format(key, value) for key, value in zip(self.keys, row)]
+            if writer is not None:
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(self.keys, values)), ensure_ascii=False))
+                buffer.write("\n")
+            self.rows += 1
+            if buffer.tell() >= self.chunk_size:
+                chunk = drain()
+                if chunk:
+                    yield chunk
+            if self.rows == limit:
+                await rows.aclose()
+                break
+
+        chunk = drain()
+        if compressor is not None:
+            chunk += compressor.flush()
+        if chunk:
+            yield chunk
@@ -0,0 +1,112 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Iterable
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import Message, TelegramObject, Update
+
+from throttle import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]]
+
+
+class _UserFlood:
+    """Состояние пользователя в LRU: ведро токенов, последний альбом и было ли уже предупреждение"""
+    __slots__ = ("bucket", "album", "album_allowed", "notified")
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.album: str | None = None
+        self.album_allowed = False
+        self.notified = False
+
+
+class FloodControl(BaseMiddleware):
+    """
+    Внешний middleware апдейтов: ограничение частоты сообщений по пользователю.
+
+    Регистрируется раньше FSM-middleware, поэтому лишнее сообщение отбрасывается
+    до любого обращения к хранилищу и Bot API. У каждого пользователя своё ведро
+    токенов (`rate` в секунду, запас `burst`); вёдра лежат в LRU на `max_users`
+    записей, так что память не растёт с числом пользователей. Кто вытеснен из LRU,
+    давно не писал, и его ведро всё равно было бы полным.
+
+    Ограничиваются только сообщения. Нажатия кнопок и inline-запросы проходят
+    всегда: без ответа на них у клиента висят часики, а хранилище и лимиты чата
+    они почти не тратят. Альбом — один токен, сколько бы файлов в нём ни было.
+    О первом отброшенном сообщении пользователь получает `notice`, дальше молча —
+    до тех пор, пока сообщения снова не начнут проходить. `shed` считает
+    отброшенные сообщения.
+
+    Текст, присланный очередью сообщений, склеивает ещё webhook-обработчик, так
+    что вставка из многих строк доходит сюда одним сообщением и тратит один токен.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: float = 10.0,
+        max_users: int = 10_000,
+        exempt: Iterable[int] = (),
+        notice: str | None = None,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.exempt = frozenset(exempt)
+        self.notice = notice
+        self.shed = {"dropped": 0}
+        self._users: OrderedDict[int, _UserFlood] = OrderedDict()
+
+    async def __call__(self, handler: Handler, event: TelegramObject, data: dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is None or user.id in self.exempt or not isinstance(event, Update):
+            return await handler(event, data)
+
+        message = event.message
+        if message is None:
+            # Кнопки и inline-запросы: без ответа у клиента висят часики
+            return await handler(event, data)
+        flood = self._user(user.id)
+        if not self._allow(flood, message):
+            self.shed["dropped"] += 1
+            if self.notice is not None and not flood.notified:
+                flood.notified = True
+                await self._notify(data["bot"], message.chat.id)
+            return None
+        return await handler(event, data)
+
+    def _user(self, user_id: int) -> _UserFlood:
+        flood = self._users.get(user_id)
+        if flood is None:
+            flood = self._users[user_id] = _UserFlood(self.rate, self.burst)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return flood
+
+    def _allow(self, flood: _UserFlood, message: Message) -> bool:
+        album = message.media_group_id
+        if album is not None and album == flood.album:
+            # Файлы альбома приходят отдельными апдейтами — решение принято по первому
+            return flood.album_allowed
+        allowed = flood.bucket.wait_time(time.monotonic()) == 0
+        if allowed:
+            flood.bucket.take()
+            flood.notified = False
+        flood.album, flood.album_allowed = album, allowed
+        return allowed
+
+    async def _notify(self, bot: Any, chat_id: int) -> None:
+        try:
+            await bot.send_message(chat_id, self.notice, parse_mode=None)
+        except TelegramAPIError as e:
+            logger.warning("Не удалось предупредить чат %s о лимите сообщений: %s", chat_id, e)
+
+    def tracked_users(self) -> int:
+        return len(self._users)
@@ -0,0 +1,206 @@
+from typing import Any, Callable, NamedTuple
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message, User
+
+
+# ——— FSM ———
+class Form(StatesGroup):
+    fio = State()
+    phone = State()
+    item_type = State()
+    carcass_material = State()
+    facade_material = State()
+    visible_sides_material = State()
+    back_wall = State()
+    countertop_and_wall_panel = State()
+    canopy_height = State()
+    plinth_height = State()
+    edge_banding = State()
+    bottom_and_top_type = State()
+    technical_gaps = State()
+    hinges = State()
+    supports = State()
+    drawers = State()
+    additional_info = State()
+
+
+class InvalidAnswer(Exception):
+    """Ответ не принят; текст исключения (MarkdownV2) отправляется пользователю"""
+
+
+# ——— РАЗБОР ОТВЕТОВ ———
+def any_text(message: Message) -> str:
+    return message.text or ""
+
+
+def text_or_dash(message: Message) -> str:
+    return message.text if message.text else "—"
+
+
+def parse_fio(message: Message) -> str:
+    if not message.text:
+        raise InvalidAnswer("Пожалуйста, введите текст\\. 📝")
+    fio = message.text.strip()
+    if not fio:
+        raise InvalidAnswer("Пожалуйста, введите ваше ФИО\\. 📝")
+    return fio
+
+
+def parse_phone(message: Message) -> str:
+    # Принимаем любой текст как "телефон" (или пропуск)
+    phone_input = message.text.strip() if message.text else ""
+    return phone_input if phone_input else "—"
+
+
+def telegram_contact(user: User) -> dict[str, Any]:
+    # Получаем username или имя из аккаунта Telegram
+    full_name = f"{user.first_name or ''} {user.last_name or ''}".strip()
+    contact_info = f"@{user.username}" if user.username else full_name
+    return {"telegram_contact": contact_info, "telegram_user_id": user.id}
+
+
+# ——— ОПИСАНИЕ АНКЕТЫ ———
+class Step(NamedTuple):
+    state: State
+    key: str                     # ключ ответа в данных FSM
+    prompt: str                  # вопрос (MarkdownV2); {ключ} подставляет уже данный ответ
+    parse: Callable[[Message], str] = any_text
+    extra: Callable[[User], dict[str, Any]] | None = None      # доп. поля из профиля, сохраняемые на шаге
+    suggest: bool = False        # подсказывать ответ из прошлых заявок (inline-запросом)
+    choices: tuple[str, ...] = ()   # частые ответы — кнопками в режиме одного сообщения
+    required: bool = False       # шаг нельзя пропустить кнопкой
+
+
+STEPS: list[Step] = [
+    Step(
+        Form.fio, "fio",
+        "👤 *Ваше ФИО*\n"
+        "Пример: _Иванов Иван Иванович_",
+        parse=parse_fio,
+        required=True,
+    ),
+    Step(
+        Form.phone, "phone",
+        "Отлично\\! Здравствуйте, {fio}\\! ✨\n\n"
+        "📞 *Контактный телефон*\n"
+        "пример: _89991234567_",
+        parse=parse_phone,
+        extra=telegram_contact,
+    ),
+    Step(
+        Form.item_type, "item_type",
+        "📝 *Изделие*\n"
+        "пример: _Шкаф Малиновая д15 кв25_",
+    ),
+    Step(
+        Form.carcass_material, "carcass_material",
+        "📝 *Корпус*\n"
+        "пример: _16мм ЛДСП Платиновый белый гладкий W980 SM Egger_",
+        suggest=True,
+    ),
+    Step(
+        Form.facade_material, "facade_material",
+        "📝 *Фасады*\n"
+        "пример: _Накладные 16мм ЛДСП Вишня Риверсайд Светлая K077 PW Kronospan_",
+        suggest=True,
+    ),
+    Step(
+        Form.visible_sides_material, "visible_sides_material",
+        "📝 *Видимые боковины*\n"
+        "пример: _16мм ЛДСП Дуб сонома светлый U103 ST9 Egger_",
+        suggest=True,
+        choices=("нет",),
+    ),
+    Step(
+        Form.back_wall, "back_wall",
+        "📝 *Задняя стенка*\n"
+        "пример: _ХДФ 3мм в паз_ или _нет_",
+        choices=("ХДФ 3мм в паз", "нет"),
+    ),
+    Step(
+        Form.countertop_and_wall_panel, "countertop_and_wall_panel",
+        "📝 *Столешница и панель*\n"
+        "пример: _Столешница 38мм, стеновая панель 6мм_ или _нет_",
+        choices=("нет",),
+    ),
+    Step(
+        Form.canopy_height, "canopy_height",
+        "📝 *Козырёк*\n"
+        "пример: _60мм_ или _без козырька_",
+        choices=("60мм", "без козырька"),
+    ),
+    Step(
+        Form.plinth_height, "plinth_height",
+        "📝 *Цоколь*\n"
+        "пример: _60мм материал корпуса_",
+        choices=("60мм материал корпуса",),
+    ),
+    Step(
+        Form.edge_banding, "edge_banding",
+        "📝 *Кромка*\n"
+        "пример: _Корпус 1мм вкруг все детали, Фасады 2мм_",
+        suggest=True,
+    ),
+    Step(
+        Form.bottom_and_top_type, "bottom_and_top_type",
+        "📝 *Дно и крышка*\n"
+        "пример: _Дно вкладное, крышка накладная_",
+    ),
+    Step(
+        Form.technical_gaps, "technical_gaps",
+        "📝 *Технологические зазоры*\n"
+        "пример: _По бокам изделия 10мм суммарно, от потолка 15мм_",
+    ),
+    Step(
+        Form.hinges, "hinges",
+        "📝 *Петли*\n"
+        "пример: _Крестовые на евровинтах_",
+        suggest=True,
+    ),
+    Step(
+        Form.supports, "supports",
+        "📝 *Опоры*\n"
+        "пример: _Кухонные 60мм_",
+    ),
+    Step(
+        Form.drawers, "drawers",
+        "📝 *Ящики*\n"
+        "пример: _Дерев ящ на напр скрыт монт с доводчиком Firmax_",
+        suggest=True,
+    ),
+    Step(
+        Form.additional_info, "additional_description",
+        "📝 *Дополнительное описание*\n"
+        "Особенности, пожелания, примечания\n\n"
+        "Если нет, напишите _нет_",
+        parse=text_or_dash,
+        choices=("нет",),
+    ),
+]
+
+# Шаг по строковому состоянию FSM и следующий за ним шаг (None — анкета заполнена)
+STEP_BY_STATE: dict[str, Step] = {step.state.state: step for step in STEPS}
+NEXT_STEP: dict[str, Step | None] = {
+    step.state.state: STEPS[i + 1] if i + 1 < len(STEPS) else None
+    for i, step in enumerate(STEPS)
+}
+PREV_STEP: dict[str, Step | None] = {
+    step.state.state: STEPS[i - 1] if i else None
+    for i, step in enumerate(STEPS)
+}
+STEP_INDEX: dict[str, int] = {step.state.state: i for i, step in enumerate(STEPS)}
+
+# Поля готовой заявки — столбцы архива
+APPLICATION_FIELDS: tuple[str, ...] = (
+    "telegram_contact",
+    "telegram_user_id",
+    *(step.key for step in STEPS),
+)
+
+# Поля, по прошлым ответам на которые строятся подсказки
+SUGGEST_FIELDS: tuple[str, ...] = tuple(step.key for step in STEPS if step.suggest)
+
+# Все ключи данных сессии в порядке шагов — по ним хранилище раскладывает запись по слотам.
+# attachments — file_id присланных файлов, media_group_id — альбом, получение которого уже подтвердили
+SESSION_FIELDS: tuple[str, ...] = ("prev_bot_message_id", "attachments", "media_group_id", *APPLICATION_FIELDS)
@@ -0,0 +1,155 @@
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Методы, которые вызывает бот, — гистограммы для них создаются заранее
+KNOWN_METHODS = (
+    "sendMessage", "deleteMessage", "deleteMessages", "editMessageText",
+    "setWebhook", "deleteWebhook", "getWebhookInfo", "getMe",
+)
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами: observe() только увеличивает счётчики"""
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str) -> list[str]:
+        lines, total = [], 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        total += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {total}")
+        return lines
+
+
+class Metrics:
+    """
+    Метрики бота в формате Prometheus.
+
+    Все гистограммы и счётчики создаются при старте, на пути апдейта только
+    увеличиваются числа; текст экспозиции собирается лишь при запросе /metrics.
+    Дополнительные значения (хранилище, планировщик, очередь webhook) подключаются
+    через `add_collector` и опрашиваются тоже только при скрейпе.
+    """
+
+    def __init__(self, states: list[str]):
+        self.handler_latency = {state: Histogram() for state in [*states, "none"]}
+        self.api_latency = {method: Histogram() for method in KNOWN_METHODS}
+        self.api_errors = dict.fromkeys(KNOWN_METHODS, 0)
+        self.applications_completed = 0
+        self._completed_at: deque[float] = deque()
+        self._collectors: list[Callable[[], Awaitable[dict[str, float]]]] = []
+
+    def observe_api(self, method: str, seconds: float, failed: bool) -> None:
+        histogram = self.api_latency.get(method)
+        if histogram is None:
+            histogram = self.api_latency[method] = Histogram()
+            self.api_errors[method] = 0
+        histogram.observe(seconds)
+        if failed:
+            self.api_errors[method] += 1
+
+    def application_completed(self) -> None:
+        self.applications_completed += 1
+        self._completed_at.append(time.monotonic())
+
+    def add_collector(self, collector: Callable[[], Awaitable[dict[str, float]]]) -> None:
+        """
+        await collector() возвращает {имя_метрики: значение}; имя может содержать
+        метки (`name{op="x"}`), имена на _total выводятся как counter, остальные —
+        как gauge. Коллектор асинхронный: запросы к базам идут в своих потоках под
+        замками компонентов, а не в event loop
+        """
+        self._collectors.append(collector)
+
+    async def render(self) -> str:
+        lines = ["# TYPE mebel_handler_seconds histogram"]
+        for state, histogram in self.handler_latency.items():
+            lines += histogram.render("mebel_handler_seconds", f'state="{state}"')
+
+        lines.append("# TYPE mebel_bot_api_seconds histogram")
+        for method, histogram in self.api_latency.items():
+            lines += histogram.render("mebel_bot_api_seconds", f'method="{method}"')
+        lines.append("# TYPE mebel_bot_api_errors_total counter")
+        for method, errors in self.api_errors.items():
+            lines.append(f'mebel_bot_api_errors_total{{method="{method}"}} {errors}')
+
+        cutoff = time.monotonic() - 60
+        while self._completed_at and self._completed_at[0] < cutoff:
+            self._completed_at.popleft()
+        lines.append("# TYPE mebel_applications_completed_total counter")
+        lines.append(f"mebel_applications_completed_total {self.applications_completed}")
+        lines.append("# TYPE mebel_applications_last_minute gauge")
+        lines.append(f"mebel_applications_last_minute {len(self._completed_at)}")
+
+        typed = set()
+        for collector in self._collectors:
+            for name, value in (await collector()).items():
+                base = name.split("{", 1)[0]
+                if base not in typed:
+                    typed.add(base)
+                    lines.append(f"# TYPE {base} {'counter' if base.endswith('_total') else 'gauge'}")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=await self.render(), content_type="text/plain", charset="utf-8")
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: время обработки по состоянию Form"""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            histogram = self.metrics.handler_latency.get(data.get("raw_state") or "none")
+            if histogram is not None:
+                histogram.observe(time.perf_counter() - started)
+
+
+class MetricsRequestMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: задержка и ошибки Bot API по методам"""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = await make_request(bot, method)
+            failed = False
+            return response
+        finally:
+            self.metrics.observe_api(method.__api_method__, time.perf_counter() - started, failed)
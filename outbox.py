@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Callable, Sequence, TypeVar
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from attachments import Attachment, plan_media_groups, send_media_group
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Ограничение Telegram на длину одного сообщения
+MESSAGE_LIMIT = 4096
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    """Режет текст на части не длиннее limit, по возможности по переводам строк"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+
+class Outbox:
+    """
+    Надёжная очередь заявок для админа.
+
+    `append` дописывает заявку в SQLite и возвращается после фиксации на диске
+    (записи от одновременных заявок объединяются в одну транзакцию с fsync),
+    а фоновый воркер доставляет очередь в Telegram с повторами. Ключ идемпотентности
+    не даёт записать одну заявку дважды, а счётчик отправленных частей — повторно
+    отправить уже доставленную часть длинной заявки. Вложения (file_id) уходят
+    вслед за текстом альбомами по 10, с таким же счётчиком отправленных альбомов.
+
+    Заявки доставляются по порядку, и ошибка сети или 429 останавливает очередь до
+    повтора с нарастающей паузой. Заявку, которую Telegram отвергает по существу
+    (неверный file_id, подпись, нет доступа к чату) или которая не ушла за
+    `max_attempts` попыток, воркер помечает `failed_at`, пишет в лог и переходит
+    к следующей — одна такая заявка не держит все остальные.
+
+    Если в базу пишут несколько процессов, доставляет только один (`deliver=True`),
+    и он же раз в `poll_interval` секунд проверяет заявки, записанные соседями.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        bot: Bot,
+        chat_id: int,
+        commit_window: float = 0.005,
+        max_backoff: float = 300.0,
+        max_attempts: int = 50,
+        deliver: bool = True,
+        poll_interval: float | None = None,
+    ):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.commit_window = commit_window
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.deliver = deliver
+        self.poll_interval = poll_interval
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT NOT NULL UNIQUE,"
+            " text TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " sent_chunks INTEGER NOT NULL DEFAULT 0,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " delivered_at REAL)"
+        )
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(outbox)")}
+        for column, definition in (
+            ("attachments", "TEXT"), ("sent_groups", "INTEGER NOT NULL DEFAULT 0"), ("failed_at", "REAL"),
+        ):
+            if column not in existing:
+                try:
+                    self._db.execute(f"ALTER TABLE outbox ADD COLUMN {column} {definition}")
+                except sqlite3.OperationalError as e:
+                    # Соседний воркер успел добавить столбец раньше
+                    if "duplicate column" not in str(e):
+                        raise
+        self._db_lock = asyncio.Lock()
+
+        self._pending: list[tuple[str, str, str | None, float]] = []
+        self._committed: asyncio.Future | None = None
+        self._committer: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+
+    # ——— ЗАПИСЬ ———
+    async def append(self, key: str, text: str, attachments: Sequence[Attachment] = ()) -> None:
+        """Сохраняет заявку; после возврата она переживёт рестарт процесса"""
+        encoded = json.dumps(attachments, ensure_ascii=False) if attachments else None
+        self._pending.append((key, text, encoded, time.time()))
+        if self._committed is None:
+            self._committed = asyncio.get_running_loop().create_future()
+            self._committer = asyncio.create_task(self._commit())
+        with span("outbox.commit"):
+            await asyncio.shield(self._committed)
+        self.start()
+        self._wakeup.set()
+
+    async def _commit(self) -> None:
+        # Короткое окно, чтобы одновременные заявки легли одной транзакцией
+        await asyncio.sleep(self.commit_window)
+        rows, self._pending = self._pending, []
+        committed, self._committed = self._committed, None
+        try:
+            await self._in_thread(self._insert, rows)
+        except Exception as e:
+            committed.set_exception(e)
+        else:
+            committed.set_result(None)
+
+    def _insert(self, rows: list[tuple[str, str, str | None, float]]) -> None:
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO outbox (key, text, attachments, created_at) VALUES (?, ?, ?, ?)", rows,
+            )
+
+    # ——— ДОСТАВКА ———
+    def start(self) -> None:
+        if self.deliver and self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+            # Доставляем то, что осталось с прошлого запуска
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.deliver_pending()
+                backoff = 1.0
+            except Exception as e:
+                logger.warning("Не удалось доставить заявку админу, повтор через %.0f с: %s", backoff, e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                self._wakeup.set()
+
+    async def deliver_pending(self) -> None:
+        rows = await self._in_thread(
+            lambda: self._db.execute(
+                "SELECT id, key, text, sent_chunks, attachments, sent_groups, attempts FROM outbox"
+                " WHERE delivered_at IS NULL AND failed_at IS NULL ORDER BY id"
+            ).fetchall()
+        )
+        for row_id, key, text, sent_chunks, attachments, sent_groups, attempts in rows:
+            try:
+                await self._deliver(row_id, text, sent_chunks, attachments, sent_groups)
+            except (TelegramBadRequest, TelegramForbiddenError) as e:
+                # Повтор не поможет: запрос отвергнут по существу
+                await self._fail(row_id, key, e)
+            except Exception as e:
+                await self._update("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", (row_id,))
+                if attempts + 1 < self.max_attempts:
+                    raise
+                await self._fail(row_id, key, e)
+
+    async def _deliver(
+        self, row_id: int, text: str, sent_chunks: int, attachments: str | None, sent_groups: int,
+    ) -> None:
+        chunks = split_message(text)
+        for index in range(sent_chunks, len(chunks)):
+            await self.bot.send_message(chat_id=self.chat_id, text=chunks[index], parse_mode=None)
+            # Отмечаем каждую часть, чтобы повтор не прислал её второй раз
+            await self._update("UPDATE outbox SET sent_chunks = ? WHERE id = ?", (index + 1, row_id))
+        groups = plan_media_groups(json.loads(attachments)) if attachments else []
+        for index in range(sent_groups, len(groups)):
+            await send_media_group(self.bot, self.chat_id, groups[index])
+            await self._update("UPDATE outbox SET sent_groups = ? WHERE id = ?", (index + 1, row_id))
+        await self._update("UPDATE outbox SET delivered_at = ? WHERE id = ?", (time.time(), row_id))
+
+    async def _fail(self, row_id: int, key: str, error: Exception) -> None:
+        logger.error("Заявка %s (%s) не доставлена админу и снята с очереди: %s", row_id, key, error)
+        await self._update("UPDATE outbox SET failed_at = ? WHERE id = ?", (time.time(), row_id))
+
+    async def _update(self, sql: str, params: tuple) -> None:
+        await self._in_thread(self._db.execute, sql, params)
+
+    async def _in_thread(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Запрос к базе в отдельном потоке под `_db_lock`. Отмена ждущей задачи не
+        отпускает замок, пока поток не закончит: иначе `close` закрыл бы соединение
+        посреди запроса.
+        """
+        async with self._db_lock:
+            future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                await asyncio.gather(future, return_exceptions=True)
+                raise
+
+    async def pending_count(self) -> int:
+        return await self._in_thread(
+            lambda: self._db.execute(
+                "SELECT COUNT(*) FROM outbox WHERE delivered_at IS NULL AND failed_at IS NULL"
+            ).fetchone()[0]
+        )
+
+    async def close(self) -> None:
+        if self._committer is not None:
+            await asyncio.gather(self._committer, return_exceptions=True)
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        async with self._db_lock:
+            self._db.close()
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Awaitable, Callable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class Profile(NamedTuple):
+    stacks: Counter[str]     # «корень;…;лист» → число сэмплов
+    interval: float          # секунд процессорного времени на сэмпл
+    seconds: float           # сколько длилось профилирование
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed(self) -> bytes:
+        """Формат collapsed stacks — его понимают flamegraph.pl, speedscope и inferno"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()).encode()
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профайлер event loop, включаемый по запросу.
+
+    Пока профилирование не запущено, профайлер ничего не стоит: ни таймера, ни
+    хуков на вызовы функций. `start` взводит ITIMER_PROF — ядро присылает SIGPROF
+    каждые `interval` секунд процессорного времени процесса, и обработчик сигнала
+    записывает стек, на котором прервался главный поток. Сэмплы идут только пока
+    процесс занят CPU, так что простой цикла в профиль не попадает. Через `seconds`
+    таймер снимается, а `Profile` уходит в `report`. Одновременно — один запуск.
+
+    Сигналы обрабатывает только главный поток, поэтому event loop должен работать
+    в нём (так и запускается бот); на платформах без setitimer профайлер недоступен.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._labels: dict[CodeType, str] = {}
+        # Длинные префиксы первыми: путь от site-packages, а не от корня окружения
+        self._prefixes = sorted({os.path.abspath(path) + os.sep for path in sys.path if path}, key=len, reverse=True)
+        self._task: asyncio.Task | None = None
+        self._previous_handler = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, seconds: float, report: Callable[[Profile], Awaitable[None]]) -> None:
+        if self.running:
+            raise RuntimeError("Профилирование уже запущено")
+        stacks: Counter[str] = Counter()
+
+        def sample(signum: int, frame: FrameType | None) -> None:
+            stacks[self._stack(frame)] += 1
+
+        self._previous_handler = signal.signal(signal.SIGPROF, sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self._task = asyncio.create_task(self._run(seconds, stacks, report))
+
+    def _disarm(self) -> None:
+        if self._previous_handler is not None:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler)
+            self._previous_handler = None
+
+    async def _run(self, seconds: float, stacks: Counter[str], report: Callable[[Profile], Awaitable[None]]) -> None:
+        started = time.monotonic()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._disarm()
+        try:
+            await report(Profile(stacks, self.interval, time.monotonic() - started))
+        except Exception:
+            logger.exception("Не удалось отправить профиль")
+
+    def _stack(self, frame: FrameType | None) -> str:
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = self._label(code)
+            labels.append(label)
+            frame = frame.f_back
+        labels.reverse()
+        return ";".join(labels)
+
+    def _label(self, code: CodeType) -> str:
+        path = code.co_filename
+        for prefix in self._prefixes:
+            if path.startswith(prefix):
+                path = path[len(prefix):]
+                break
+        # ';' разделяет кадры в collapsed-формате
+        name = getattr(code, "co_qualname", code.co_name)
+        return f"{name} ({path}:{code.co_firstlineno})".replace(";", ":")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Задачу могли отменить до первого шага — тогда её finally не выполнялся
+        self._disarm()
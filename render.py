@@ -0,0 +1,267 @@
+import time
+from string import Formatter
+from typing import Any, Callable, Mapping, Sequence
+
+from aiogram.enums import ParseMode
+
+from archive import HIGHLIGHT_END, HIGHLIGHT_START, SearchPage
+from attachments import MAX_ATTACHMENTS
+from form import STEP_INDEX, STEPS, Step
+
+# ——— ЭКРАНИРОВАНИЕ ———
+# Цепочка str.replace по символам, реально встречающимся в строке: каждый проход —
+# один вызов C-кода, а ответы почти целиком кириллица, на которой str.translate
+# и посимвольный генератор тратят время на каждый символ. Обратный слэш и «&»
+# идут первыми, чтобы не экранировать уже вставленные escape-последовательности.
+_MARKDOWN_V2_SPECIALS = tuple((char, f"\\{char}") for char in "\\_*[]()~`>#+-=|{}.!")
+_HTML_SPECIALS = (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"))
+
+
+def _replace_all(text: str, specials: tuple[tuple[str, str], ...]) -> str:
+    for char, escaped in specials:
+        if char in text:
+            text = text.replace(char, escaped)
+    return text
+
+
+def escape_markdown_v2(text: str) -> str:
+    """Экранирует спецсимволы для MarkdownV2"""
+    return _replace_all(text, _MARKDOWN_V2_SPECIALS)
+
+
+def escape_html(text: str) -> str:
+    """Экранирует спецсимволы для HTML"""
+    return _replace_all(text, _HTML_SPECIALS)
+
+
+ESCAPERS: dict[str, Callable[[str], str]] = {
+    ParseMode.MARKDOWN_V2: escape_markdown_v2,
+    ParseMode.HTML: escape_html,
+}
+
+
+# ——— ШАБЛОНЫ ———
+class Template:
+    """
+    Текст с подстановками {ключ}, разобранный при импорте.
+
+    Подставленные значения экранируются под parse_mode; текст без подстановок
+    отдаётся как есть, без какой-либо работы на каждый вызов.
+    """
+    __slots__ = ("literals", "keys", "static", "escape")
+
+    def __init__(self, source: str, parse_mode: str = ParseMode.MARKDOWN_V2):
+        self.escape = ESCAPERS[parse_mode]
+        self.literals: list[str] = []
+        self.keys: list[str] = []
+        pending = ""
+        for literal, key, _, _ in Formatter().parse(source):
+            pending += literal
+            if key is not None:
+                self.literals.append(pending)
+                self.keys.append(key)
+                pending = ""
+        self.literals.append(pending)
+        self.static = self.literals[0] if not self.keys else None
+
+    def render(self, data: Mapping[str, Any] | None = None) -> str:
+        if self.static is not None:
+            return self.static
+        parts = []
+        for literal, key in zip(self.literals, self.keys):
+            parts.append(literal)
+            parts.append(self.escape(str(data.get(key, ""))))
+        parts.append(self.literals[-1])
+        return "".join(parts)
+
+
+class SummaryTemplate:
+    """Текст заявки для админа: строки «Подпись: значение» в порядке полей, разделы через пустую строку"""
+    __slots__ = ("format", "keys", "missing")
+
+    def __init__(self, header: str, sections: Sequence[Sequence[tuple[str, str]]], missing: str = "—"):
+        lines = [header.replace("{", "{{").replace("}", "}}")]
+        self.keys: tuple[str, ...] = ()
+        for section in sections:
+            lines.append("\n".join(f"{label}: {{}}" for _, label in section))
+            self.keys += tuple(key for key, _ in section)
+        self.format = "\n\n".join(lines)
+        self.missing = missing
+
+    def render(self, data: Mapping[str, Any]) -> str:
+        return self.format.format(*[data.get(key, self.missing) for key in self.keys])
+
+
+# ——— ТЕКСТЫ БОТА ———
+START_PROMPT = Template(
+    "Здравствуйте\\! 👋\n\n"
+    "Я помогу вам оформить заявку на проектирование мебели\\.\n"
+    "Начнём с простого:\n\n"
+    + STEPS[0].prompt
+)
+
+# Вопрос каждого шага по строковому состоянию FSM
+PROMPTS: dict[str, Template] = {step.state.state: Template(step.prompt) for step in STEPS}
+
+# Обычный текст, отправляется с parse_mode=None
+DONE_MESSAGE = (
+    "Заявка отправлена! 🎉\n\n"
+    "Мы создадим в Telegram персональную группу для данного проекта и добавим в неё вас. "
+    "Там можно будет обсуждать детали и обмениваться файлами.\n\n"
+    "Хорошего дня! 👍\n\n"
+    "Для новой заявки отправьте /start"
+)
+
+SUMMARY_SECTIONS: list[list[tuple[str, str]]] = [
+    [
+        ("fio", "ФИО"),
+        ("telegram_contact", "Telegram"),
+        ("phone", "Телефон"),
+        ("item_type", "Изделие"),
+    ],
+    [
+        ("carcass_material", "Корпус"),
+        ("facade_material", "Фасады"),
+        ("visible_sides_material", "Видимые боковины"),
+        ("back_wall", "Задняя стенка"),
+        ("countertop_and_wall_panel", "Столешница / панель"),
+        ("canopy_height", "Козырёк"),
+        ("plinth_height", "Цоколь"),
+        ("edge_banding", "Кромка"),
+        ("bottom_and_top_type", "Дно / крышка"),
+        ("technical_gaps", "Тех. зазоры"),
+        ("hinges", "Петли"),
+        ("supports", "Опоры"),
+        ("drawers", "Ящики"),
+        ("additional_description", "Доп. описание"),
+    ],
+]
+
+ADMIN_SUMMARY = SummaryTemplate("📩 Новая заявка на проектирование мебели", SUMMARY_SECTIONS)
+
+
+# ——— ВЛОЖЕНИЯ ———
+def attachments_note(count: int) -> str:
+    """Подтверждение полученных файлов (MarkdownV2)"""
+    note = f"📎 Файлов получено: {count}"
+    if count >= MAX_ATTACHMENTS:
+        note += f" — это максимум, больше {MAX_ATTACHMENTS} не примем"
+    return note
+
+
+def summary_attachments_line(count: int) -> str:
+    # Обычный текст: строка в заявке админу, сами файлы приходят следом альбомами
+    return f"\n\n📎 Вложений: {count} (ниже)"
+
+
+# ——— АНКЕТА ОДНИМ СООБЩЕНИЕМ ———
+# Подписи уже данных ответов над текущим вопросом, экранированные один раз
+_CARD_LABELS: dict[str, str] = {
+    key: escape_markdown_v2(label) for section in SUMMARY_SECTIONS for key, label in section
+}
+# Длинные ответы в сводке обрезаем: сообщение Telegram — не больше 4096 символов
+CARD_VALUE_LIMIT = 60
+
+# Обычный текст кнопок
+BACK_BUTTON = "⬅️ Назад"
+SKIP_BUTTON = "Пропустить ➡️"
+
+
+def render_form_card(step: Step, data: Mapping[str, Any], error: str | None = None) -> str:
+    """
+    Единственное сообщение анкеты (MarkdownV2): номер шага, ответы на предыдущие
+    шаги и текущий вопрос; `error` (уже MarkdownV2) — почему не принят ответ.
+    """
+    index = STEP_INDEX[step.state.state]
+    lines = [f"*Шаг {index + 1} из {len(STEPS)}*"]
+    for answered in STEPS[:index]:
+        value = data.get(answered.key)
+        if value is None:
+            continue
+        value = str(value)
+        if len(value) > CARD_VALUE_LIMIT:
+            value = value[:CARD_VALUE_LIMIT - 1] + "…"
+        lines.append(f"▫️ {_CARD_LABELS[answered.key]}: {escape_markdown_v2(value)}")
+    if data.get("attachments"):
+        lines.append(attachments_note(len(data["attachments"])))
+    lines.append("")
+    if error:
+        lines.append(f"⚠️ {error}\n")
+    lines.append(START_PROMPT.render() if index == 0 else PROMPTS[step.state.state].render(data))
+    return "\n".join(lines)
+
+
+# ——— ПОИСК ПО АРХИВУ (/find) ———
+# Обычный текст, отправляется с parse_mode=None
+FIND_USAGE = "Поиск по заявкам: /find <запрос>\nНапример: /find кухня W980"
+
+
+def render_search_page(page: SearchPage) -> str:
+    """Страница результатов /find (MarkdownV2): подсвеченный фрагмент и контакты каждой заявки"""
+    query = escape_markdown_v2(page.query)
+    if not page.total:
+        return f"🔎 По запросу _{query}_ ничего не найдено"
+
+    lines = [f"🔎 *Найдено: {page.total}* · страница {page.page + 1}/{page.pages}", f"запрос: _{query}_"]
+    for number, hit in enumerate(page.hits, start=page.offset + 1):
+        title = escape_markdown_v2(hit["fio"] or "—")
+        item = escape_markdown_v2(hit["item_type"] or "—")
+        snippet = escape_markdown_v2(hit["snippet"] or "").replace(HIGHLIGHT_START, "*").replace(HIGHLIGHT_END, "*")
+        details = " · ".join(
+            escape_markdown_v2(value) for value in (
+                time.strftime("%d.%m.%Y", time.localtime(hit["created_at"])), hit["phone"], hit["telegram_contact"],
+            ) if value
+        )
+        lines.append(f"\n*{number}\\. {title}* — {item}\n{snippet}\n_{details}_")
+    return "\n".join(lines)
+
+
+# ——— ПОДСКАЗКИ ОТВЕТОВ ———
+# Обычный текст: кнопка под вопросом и подпись к варианту в списке подсказок
+SUGGEST_BUTTON = "🔎 Выбрать из прошлых заявок"
+
+
+def suggestion_description(count: int) -> str:
+    return f"в заявках: {count}"
+
+
+# ——— ВЫГРУЗКА (/export) ———
+# Столбцы в порядке заявки админу, плюс номер, дата и числовой id в Telegram
+EXPORT_COLUMNS: list[tuple[str, str]] = [
+    ("id", "№"),
+    ("created_at", "Дата"),
+    *(column for section in SUMMARY_SECTIONS for column in section),
+    ("telegram_user_id", "Telegram ID"),
+]
+
+# Обычный текст, отправляется с parse_mode=None
+EXPORT_USAGE = (
+    "Выгрузка заявок: /export [csv|jsonl] [gz] [с даты] [по дату] [изделие]\n"
+    "Даты — 2026-01-31 или 31.01.2026, обе включительно. gz — сжать; больше 50 МБ (лимит Telegram) сжимается само.\n"
+    "Например: /export jsonl 01.09.2026 30.09.2026 кухня"
+)
+EXPORT_EMPTY = "За этот период таких заявок нет"
+EXPORT_TOO_LARGE = "Выгрузка больше 50 МБ даже в сжатом виде — Telegram её не примет. Сузьте период или отберите изделие"
+
+
+def export_caption(total: int, compressed: bool = False) -> str:
+    return f"Заявок в выгрузке: {total}" + (" (сжато gzip)" if compressed else "")
+
+
+# ——— ОГРАНИЧЕНИЕ ЧАСТОТЫ ———
+FLOOD_NOTICE = "Слишком много сообщений подряд — последние я пропустил. Подождите несколько секунд и отправьте ответ ещё раз"
+
+# ——— ПРОФИЛИРОВАНИЕ ———
+PROFILE_USAGE = (
+    "Профилирование: /profile [секунды], по умолчанию {default:.0f}, не больше {limit:.0f}.\n"
+    "Пришлю файл collapsed stacks — открыть в speedscope.app или flamegraph.pl"
+)
+PROFILE_BUSY = "Профилирование уже идёт — дождитесь файла"
+
+
+def profile_started(seconds: float) -> str:
+    return f"Профилирую {seconds:.0f} с, потом пришлю файл"
+
+
+def profile_caption(samples: int, cpu_seconds: float, seconds: float) -> str:
+    return f"Сэмплов: {samples} (≈{cpu_seconds:.1f} с процессорного времени) за {seconds:.0f} с"
@@ -0,0 +1,61 @@
+import hashlib
+import logging
+import os
+import time
+
+from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Длительность фаз запуска: каждая `mark` закрывает фазу, начатую предыдущей"""
+
+    def __init__(self, started: float | None = None):
+        self.started = self.last = started if started is not None else time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def log(self, title: str) -> None:
+        breakdown = ", ".join(f"{phase} {seconds * 1e3:.0f} мс" for phase, seconds in self.phases)
+        logger.info("%s за %.0f мс: %s", title, (self.last - self.started) * 1e3, breakdown)
+
+
+def webhook_fingerprint(url: str, secret: str | None) -> str:
+    # Сам секрет на диск не пишем — только хеш пары
+    return hashlib.sha256(f"{url}\0{secret or ''}".encode()).hexdigest()
+
+
+async def ensure_webhook(bot: Bot, url: str, secret: str | None, state_path: str) -> bool:
+    """
+    Регистрирует webhook, только если он отличается от уже установленного.
+
+    getWebhookInfo не возвращает секрет, поэтому отпечаток URL и секрета после
+    регистрации сохраняется в `state_path`. Накопившиеся апдейты не сбрасываются:
+    их дообработает бот, а повторы отсечёт дедупликатор. Возвращает True, если
+    webhook пришлось переустановить.
+    """
+    fingerprint = webhook_fingerprint(url, secret)
+    try:
+        with open(state_path) as f:
+            stored = f.read().strip()
+    except OSError:
+        stored = None
+
+    info = await bot.get_webhook_info()
+    # Без файла (например, диск не постоянный) и без секрета сверять нечего, кроме URL
+    if info.url == url and (stored == fingerprint or (stored is None and not secret)):
+        logger.info("Webhook уже установлен, ожидают обработки: %d", info.pending_update_count)
+        return False
+
+    await bot.set_webhook(url=url, secret_token=secret, drop_pending_updates=False)
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(fingerprint)
+    os.replace(tmp_path, state_path)
+    logger.info("Webhook переустановлен, ожидают обработки: %d", info.pending_update_count)
+    return True
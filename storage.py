@@ -0,0 +1,352 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import defaultdict
+from operator import attrgetter
+from typing import Any, Callable, Mapping, Sequence, TypeVar
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+T = TypeVar("T")
+
+
+class _RecordBase:
+    """
+    Запись сессии в кэше чтения.
+
+    Известные поля анкеты лежат в слотах подкласса (см. `make_record_type`),
+    всё остальное — в необязательном словаре `extra`. Так сессия занимает один
+    объект фиксированного размера вместо словаря на каждого пользователя.
+    """
+    __slots__ = ("state", "updated_at", "extra")
+    FIELDS: tuple[str, ...] = ()
+    FIELD_SET: frozenset[str] = frozenset()
+    _get_fields = staticmethod(lambda record: ())
+
+    def __init__(self, state: str | None = None, data: Mapping[str, Any] | None = None):
+        self.state = state
+        self.updated_at = time.time()
+        self.set_data(data or {})
+
+    def get_data(self) -> dict[str, Any]:
+        data = {name: value for name, value in zip(self.FIELDS, self._get_fields(self)) if value is not _MISSING}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def set_data(self, data: Mapping[str, Any]) -> None:
+        for name in self.FIELDS:
+            setattr(self, name, data.get(name, _MISSING))
+        extra = {key: value for key, value in data.items() if key not in self.FIELD_SET}
+        self.extra = extra or None
+
+    def update_data(self, data: Mapping[str, Any]) -> None:
+        for key, value in data.items():
+            if key in self.FIELD_SET:
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.extra and all(
+            value is _MISSING for value in self._get_fields(self)
+        )
+
+
+def make_record_type(fields: Sequence[str]) -> type[_RecordBase]:
+    """Класс записи со слотами под поля анкеты в порядке шагов Form"""
+    fields = tuple(fields)
+    namespace: dict[str, Any] = {"__slots__": fields, "FIELDS": fields, "FIELD_SET": frozenset(fields)}
+    if len(fields) == 1:
+        namespace["_get_fields"] = staticmethod(lambda record, get=attrgetter(fields[0]): (get(record),))
+    elif fields:
+        namespace["_get_fields"] = staticmethod(attrgetter(*fields))
+    return type("SessionRecord", (_RecordBase,), namespace)
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище на SQLite (WAL) с кэшем чтения в памяти процесса.
+
+    Все чтения обслуживаются из кэша, в базу идём только при первом обращении
+    к сессии (например, после рестарта). Записи копятся в наборе «грязных» ключей
+    и сбрасываются фоновой задачей одной транзакцией раз в `flush_interval` секунд,
+    так что при падении процесса теряется не больше одного такого окна.
+
+    Сессии, не менявшиеся дольше `session_ttl` секунд, удаляются и из кэша, и из базы.
+    Пустые записи (пользователь без анкеты: только /start, inline-запрос или анкета
+    уже завершена) живут в кэше лишь `empty_ttl` секунд — иначе память росла бы с
+    числом всех, кто когда-либо писал боту. Сроки хранятся в «колесе таймеров» — корзинах по `sweep_interval` секунд, по одной
+    ссылке на сессию, так что проверка разбирает только истёкшие корзины, а не весь кэш.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fields: Sequence[str] = (),
+        flush_interval: float = 0.05,
+        session_ttl: float = 7 * 24 * 3600,
+        sweep_interval: float = 60.0,
+        empty_ttl: float = 300.0,
+        key_builder: KeyBuilder | None = None,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.session_ttl = session_ttl
+        self.sweep_interval = sweep_interval
+        self.empty_ttl = empty_ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.record_type = make_record_type(fields)
+
+        # Пишем из фонового потока, читаем из event loop — отдельные соединения,
+        # чтобы промах кэша не ждал транзакцию сброса
+        self._writer = self._connect()
+        self._writer.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            " key TEXT PRIMARY KEY,"
+            " state TEXT,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._writer.execute("CREATE INDEX IF NOT EXISTS fsm_updated_at ON fsm (updated_at)")
+        self._reader = self._connect()
+
+        self.ops = dict.fromkeys(
+            ("get_state", "set_state", "get_data", "set_data", "update_data", "set_state_and_data", "db_read", "db_flush"), 0
+        )
+        self.expired = 0
+        self._cache: dict[StorageKey, _RecordBase] = {}
+        self._wheel: defaultdict[int, list[StorageKey]] = defaultdict(list)
+        self._dirty: set[StorageKey] = set()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._sweeper: asyncio.Task | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    # ——— КЭШ ———
+    def _record(self, key: StorageKey) -> _RecordBase:
+        record = self._cache.get(key)
+        if record is None:
+            self.ops["db_read"] += 1
+            # Единственная операция хранилища, которая ждёт диск на пути апдейта
+            with span("storage.db_read"):
+                row = self._reader.execute(
+                    "SELECT state, data, updated_at FROM fsm WHERE key = ?", (self.key_builder.build(key),)
+                ).fetchone()
+            record = self.record_type(row[0], json.loads(row[1])) if row else self.record_type()
+            if row:
+                record.updated_at = row[2]
+            self._cache[key] = record
+            self._schedule_expiry(key, record.updated_at + (self.session_ttl if row else self.empty_ttl))
+            # Пустые записи появляются и без единой записи в хранилище — срокам нужен сборщик
+            self._start()
+        return record
+
+    def _schedule_expiry(self, key: StorageKey, expires_at: float) -> None:
+        self._wheel[int(expires_at // self.sweep_interval)].append(key)
+
+    def _touch(self, key: StorageKey) -> None:
+        record = self._cache[key]
+        record.updated_at = time.time()
+        if record.is_empty():
+            # Анкету очистили — запись уйдёт из кэша через empty_ttl, а не через неделю
+            self._schedule_expiry(key, record.updated_at + self.empty_ttl)
+        self._dirty.add(key)
+        self._start()
+        self._wakeup.set()
+
+    def _start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    # ——— ИНТЕРФЕЙС BaseStorage ———
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self.ops["set_state"] += 1
+        self._record(key).state = state.state if isinstance(state, State) else state
+        self._touch(key)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        self.ops["get_state"] += 1
+        return self._record(key).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        self.ops["set_data"] += 1
+        self._record(key).set_data(data)
+        self._touch(key)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        self.ops["get_data"] += 1
+        return self._record(key).get_data()
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        self.ops["update_data"] += 1
+        record = self._record(key)
+        record.update_data(data)
+        self._touch(key)
+        return record.get_data()
+
+    async def set_state_and_data(self, key: StorageKey, state: StateType, data: Mapping[str, Any]) -> None:
+        """Атомарно заменяет и состояние, и данные сессии — один шаг анкеты = одна запись"""
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        self.ops["set_state_and_data"] += 1
+        record = self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        record.set_data(data)
+        self._touch(key)
+
+    async def session_counts(self, abandon_after: float) -> tuple[int, int]:
+        """Незавершённые анкеты: (активные, брошенные дольше abandon_after секунд назад)"""
+        cutoff = time.time() - abandon_after
+        # Соединение записи и его замок: читающее соединение принадлежит event loop,
+        # а считать по всей таблице в нём — значит останавливать цикл на время запроса
+        async with self._flush_lock:
+            return await self._in_writer(self._count_sessions, cutoff)
+
+    def _count_sessions(self, cutoff: float) -> tuple[int, int]:
+        active, abandoned = self._writer.execute(
+            "SELECT COUNT(*) FILTER (WHERE updated_at >= ?), COUNT(*) FILTER (WHERE updated_at < ?)"
+            " FROM fsm WHERE state IS NOT NULL",
+            (cutoff, cutoff),
+        ).fetchone()
+        return active, abandoned
+
+    async def close(self) -> None:
+        # Отменённая задача возвращается только после своего запроса к базе —
+        # дождавшись их, сбрасываем остаток сами
+        tasks = [task for task in (self._sweeper, self._flusher) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._sweeper = self._flusher = None
+        await self.flush()
+        self._reader.close()
+        self._writer.close()
+
+    # ——— ИСТЕЧЕНИЕ СЕССИЙ ———
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            await self.expire()
+
+    async def expire(self) -> int:
+        """Удаляет сессии, простоявшие дольше session_ttl; возвращает число удалённых из кэша"""
+        now = time.time()
+        current_slot = int(now // self.sweep_interval)
+        evicted = 0
+        for slot in [slot for slot in self._wheel if slot <= current_slot]:
+            for key in self._wheel.pop(slot):
+                record = self._cache.get(key)
+                if record is None:
+                    continue
+                empty = record.is_empty()
+                expires_at = record.updated_at + (self.empty_ttl if empty else self.session_ttl)
+                if expires_at > now:
+                    # Сессию трогали после постановки в колесо — переносим срок
+                    self._schedule_expiry(key, expires_at)
+                    continue
+                if empty and key in self._dirty:
+                    # Строка в базе ещё не удалена: без записи в кэше её прочитали бы снова
+                    self._schedule_expiry(key, now + self.sweep_interval)
+                    continue
+                del self._cache[key]
+                if not empty:
+                    # Брошенная анкета — удалим и строку в базе при ближайшем сбросе
+                    self._dirty.add(key)
+                    self.expired += 1
+                evicted += 1
+
+        # Строки, которые с рестарта ни разу не попадали в кэш
+        async with self._flush_lock:
+            await self._in_writer(self._delete_expired, now - self.session_ttl)
+        if self._dirty:
+            self._wakeup.set()
+        return evicted
+
+    def _delete_expired(self, cutoff: float) -> None:
+        with self._writer:
+            self._writer.execute("BEGIN")
+            self._writer.execute("DELETE FROM fsm WHERE updated_at < ?", (cutoff,))
+
+    # ——— СБРОС НА ДИСК ———
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # Даём накопиться пачке изменений от соседних апдейтов
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Записывает все накопленные изменения одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+
+            # Снимок делаем в event loop, чтобы поток записи не видел полуизменённых данных
+            upserts, deletes = [], []
+            for key in dirty:
+                record = self._cache.get(key)
+                db_key = self.key_builder.build(key)
+                if record is None or record.is_empty():
+                    deletes.append((db_key,))
+                else:
+                    upserts.append((
+                        db_key, record.state, json.dumps(record.get_data(), ensure_ascii=False), record.updated_at,
+                    ))
+
+            self.ops["db_flush"] += 1
+            try:
+                await self._in_writer(self._write, upserts, deletes)
+            except Exception:
+                logger.exception("Не удалось сбросить FSM-хранилище на диск, повторим позже")
+                self._dirty |= dirty
+
+    async def _in_writer(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Запрос через соединение записи в отдельном потоке; вызывать под `_flush_lock`.
+        Отмена ждущей задачи дожидается конца запроса: иначе замок освободился бы,
+        пока поток ещё держит транзакцию, и `close` закрыл бы соединение под ним.
+        """
+        future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.gather(future, return_exceptions=True)
+            raise
+
+    def _write(self, upserts: list[tuple], deletes: list[tuple]) -> None:
+        with self._writer:
+            self._writer.execute("BEGIN")
+            if upserts:
+                self._writer.executemany(
+                    "INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET state = excluded.state,"
+                    " data = excluded.data, updated_at = excluded.updated_at",
+                    upserts,
+                )
+            if deletes:
+                self._writer.executemany("DELETE FROM fsm WHERE key = ?", deletes)
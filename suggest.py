@@ -0,0 +1,139 @@
+import asyncio
+import heapq
+import logging
+import re
+import time
+from bisect import bisect_left, insort
+from typing import Sequence
+
+from archive import ApplicationArchive
+
+logger = logging.getLogger(__name__)
+
+# Ответ без единой буквы или цифры («—», «.») подсказывать незачем
+_WORD_RE = re.compile(r"\w")
+
+# Сколько первых слов ответа могут начинать совпадение
+MAX_WORD_STARTS = 16
+
+
+def normalize(text: str) -> str:
+    """Ключ сравнения: регистр, ё/е и пробелы не различаются"""
+    return " ".join(text.split()).casefold().replace("ё", "е")
+
+
+class PrefixIndex:
+    """
+    Подсказки по одному полю анкеты: префиксный поиск по прошлым ответам.
+
+    Каждый различный ответ попадает в отсортированный массив несколько раз — с
+    начала каждого своего слова, поэтому «w980» и «платиновый бел» находят
+    «16мм ЛДСП Платиновый белый гладкий W980 SM Egger». Поиск — два bisect по
+    массиву, новые ответы вставляются на место без перестроения, повтор
+    известного ответа только увеличивает его счётчик.
+    """
+
+    def __init__(self):
+        self._entries: list[tuple[str, int]] = []   # (хвост ответа с начала слова, номер ответа)
+        self._numbers: dict[str, int] = {}          # нормализованный ответ → номер
+        self.answers: list[str] = []                # номер → ответ в том виде, как его ввели впервые
+        self.counts: list[int] = []
+        self.last_seen: list[int] = []              # порядковый номер последней заявки с этим ответом
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+    def add(self, answer: str, seen: int) -> None:
+        key = normalize(answer)
+        if not _WORD_RE.search(key):
+            return
+        number = self._numbers.get(key)
+        if number is not None:
+            self.counts[number] += 1
+            self.last_seen[number] = max(self.last_seen[number], seen)
+            return
+
+        number = self._numbers[key] = len(self.answers)
+        self.answers.append(" ".join(answer.split()))
+        self.counts.append(1)
+        self.last_seen.append(seen)
+        start = 0
+        for _ in range(MAX_WORD_STARTS):
+            insort(self._entries, (key[start:], number))
+            start = key.find(" ", start) + 1
+            if not start:
+                break
+
+    def suggest(self, prefix: str, limit: int = 20) -> list[tuple[str, int]]:
+        """До `limit` ответов, одно из слов которых начинается с `prefix`: (ответ, сколько раз выбран)"""
+        prefix = normalize(prefix)
+        if prefix:
+            lo = bisect_left(self._entries, (prefix,))
+            hi = bisect_left(self._entries, (prefix + "\U0010ffff",), lo)
+            numbers = {number for _, number in self._entries[lo:hi]}
+        else:
+            numbers = range(len(self.answers))
+        # Чаще выбираемые выше, при равенстве — недавние
+        top = heapq.nlargest(limit, numbers, key=lambda number: (self.counts[number], self.last_seen[number]))
+        return [(self.answers[number], self.counts[number]) for number in top]
+
+
+class AnswerSuggestions:
+    """
+    Индексы подсказок по полям, наполняемые из архива заявок.
+
+    Индексы живут в памяти процесса и догружают из архива только заявки новее
+    последней прочитанной — и при старте, и после каждой новой заявки, и (не
+    чаще раза в `refresh_interval`) перед ответом на запрос подсказок, чтобы
+    видеть заявки, завершённые в соседних воркерах.
+    """
+
+    def __init__(self, archive: ApplicationArchive, fields: Sequence[str], refresh_interval: float = 1.0,
+                 batch_size: int = 1000):
+        self.archive = archive
+        self.fields = tuple(fields)
+        self.indexes = {field: PrefixIndex() for field in self.fields}
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.last_id = 0
+        self._refreshed_at = float("-inf")
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        # Архив читается в фоне: запуск бота не ждёт индексации
+        if self._task is None:
+            self._task = asyncio.create_task(self._load())
+
+    async def _load(self) -> None:
+        try:
+            await self.refresh(force=True)
+        except Exception:
+            # Без подсказок анкета работает как раньше; следующая попытка — при первом запросе
+            logger.exception("Не удалось загрузить подсказки из архива")
+
+    async def refresh(self, force: bool = False) -> None:
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        async with self._lock:
+            self._refreshed_at = time.monotonic()
+            while True:
+                rows = await self.archive.rows_since(self.last_id, self.fields, self.batch_size)
+                for row in rows:
+                    for field, value in zip(self.fields, row[1:]):
+                        if value:
+                            self.indexes[field].add(value, row[0])
+                if rows:
+                    self.last_id = rows[-1][0]
+                if len(rows) < self.batch_size:
+                    break
+
+    def suggest(self, field: str, prefix: str, limit: int = 20) -> list[tuple[str, int]]:
+        return self.indexes[field].suggest(prefix, limit)
+
+    async def close(self) -> None:
+        # Дожидаемся отменённой загрузки: архив закрывается следующим хуком
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
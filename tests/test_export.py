@@ -0,0 +1,28 @@
+import asyncio
+
+from archive import ApplicationArchive
+from export import ApplicationExport, ExportRequest
+
+FIELDS = ["item_type", "additional_info"]
+COLUMNS = [("id", "№"), ("item_type", "Изделие"), ("additional_info", "Пожелания")]
+
+
+def test_estimate_size_is_close_to_actual(tmp_path):
+    async def scenario() -> list[tuple[int, int]]:
+        archive = ApplicationArchive(str(tmp_path / "archive.sqlite3"), FIELDS)
+        for i in range(3000):
+            await archive.add(str(i), i, {"item_type": f"Кухня {i}", "additional_info": "ЛДСП " * (i % 7)})
+        total, last_id = await archive.export_bounds()
+        sizes = []
+        for request in (ExportRequest("csv"), ExportRequest("jsonl"), ExportRequest("csv", compress=True)):
+            document = ApplicationExport(archive, COLUMNS, request, last_id)
+            estimate = await document.estimate_size(total)
+            actual = 0
+            async for chunk in document.read(bot=None):
+                actual += len(chunk)
+            sizes.append((estimate, actual))
+        await archive.close()
+        return sizes
+
+    for estimate, actual in asyncio.run(scenario()):
+        assert abs(estimate - actual) <= actual * 0.1 or estimate >= actual
@@ -0,0 +1,56 @@
+import asyncio
+
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
+from aiogram.methods import SendMessage
+
+from outbox import Outbox
+
+
+class FakeBot:
+    """Bot API без сети: запоминает отправленное, на `reject` отвечает ошибкой `error`"""
+
+    def __init__(self, reject: str, error: type[Exception]):
+        self.reject = reject
+        self.error = error
+        self.sent: list[str] = []
+
+    async def send_message(self, chat_id: int, text: str, parse_mode: str | None = None) -> None:
+        if self.reject in text:
+            raise self.error(SendMessage(chat_id=chat_id, text=text), "rejected")
+        self.sent.append(text)
+
+
+def deliver(path: str, bot: FakeBot, rounds: int, **kwargs) -> tuple[int, list[str]]:
+    """Две заявки, битая первой; `rounds` проходов воркера. Возвращает остаток очереди и ошибки"""
+    async def scenario() -> tuple[int, list[str]]:
+        outbox = Outbox(path, bot, chat_id=1, deliver=False, **kwargs)
+        await outbox.append("bad", "битая заявка")
+        await outbox.append("good", "хорошая заявка")
+        errors = []
+        for _ in range(rounds):
+            try:
+                await outbox.deliver_pending()
+            except Exception as e:
+                errors.append(type(e).__name__)
+        pending = await outbox.pending_count()
+        await outbox.close()
+        return pending, errors
+
+    return asyncio.run(scenario())
+
+
+def test_rejected_row_does_not_block_queue(tmp_path):
+    bot = FakeBot("битая", TelegramBadRequest)
+    pending, errors = deliver(str(tmp_path / "outbox.sqlite3"), bot, rounds=1)
+    assert bot.sent == ["хорошая заявка"]
+    assert pending == 0
+    assert errors == []
+
+
+def test_transient_error_retries_then_gives_up(tmp_path):
+    bot = FakeBot("битая", TelegramNetworkError)
+    pending, errors = deliver(str(tmp_path / "outbox.sqlite3"), bot, rounds=3, max_attempts=3)
+    # Первые две ошибки сети держат очередь до повтора, третья снимает заявку
+    assert errors == ["TelegramNetworkError", "TelegramNetworkError"]
+    assert bot.sent == ["хорошая заявка"]
+    assert pending == 0
@@ -0,0 +1,32 @@
+import asyncio
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+
+from storage import SQLiteStorage
+
+
+def test_close_waits_for_running_sweep(tmp_path):
+    async def scenario() -> dict:
+        storage = SQLiteStorage(str(tmp_path / "fsm.sqlite3"), sweep_interval=0.01)
+
+        def slow_delete_expired(cutoff: float) -> None:
+            with storage._writer:
+                storage._writer.execute("BEGIN")
+                storage._writer.execute("DELETE FROM fsm WHERE updated_at < ?", (cutoff,))
+                # Поток ещё держит транзакцию, когда close отменяет чистку
+                time.sleep(0.2)
+
+        storage._delete_expired = slow_delete_expired
+        key = StorageKey(bot_id=1, chat_id=1, user_id=1)
+        await storage.set_data(key, {"fio": "Иванов"})
+        await asyncio.sleep(0.05)
+        await storage.set_data(key, {"fio": "Петров"})
+        await storage.close()
+
+        reopened = SQLiteStorage(str(tmp_path / "fsm.sqlite3"))
+        data = await reopened.get_data(key)
+        await reopened.close()
+        return data
+
+    assert asyncio.run(scenario()) == {"fio": "Петров"}
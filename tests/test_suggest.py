@@ -0,0 +1,43 @@
+import asyncio
+import sqlite3
+import time
+
+from archive import ApplicationArchive
+from suggest import AnswerSuggestions
+
+
+class SlowConnection:
+    """Соединение, чьи запросы идут дольше, чем остановка бота ждёт до закрытия"""
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+        self.closed_during_query = False
+        self.querying = False
+
+    def execute(self, *args):
+        self.querying = True
+        try:
+            time.sleep(0.2)
+            return self.db.execute(*args)
+        finally:
+            self.querying = False
+
+    def close(self) -> None:
+        self.closed_during_query = self.querying
+        self.db.close()
+
+
+def test_close_waits_for_loading_query(tmp_path):
+    async def scenario() -> bool:
+        archive = ApplicationArchive(str(tmp_path / "archive.sqlite3"), ["item_type"])
+        await archive.add("a", 1, {"item_type": "Кухня"})
+        connection = archive._db = SlowConnection(archive._db)
+        suggestions = AnswerSuggestions(archive, ["item_type"])
+        suggestions.start()
+        await asyncio.sleep(0.05)
+        # Порядок хуков остановки в bot.py: подсказки, затем архив
+        await suggestions.close()
+        await archive.close()
+        return connection.closed_during_query
+
+    assert asyncio.run(scenario()) is False
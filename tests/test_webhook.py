@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+from webhook import QueuedRequestHandler, UpdateDeduplicator
+
+
+class FakeDispatcher:
+    """Запоминает тексты апдейтов и сколько апдейтов числилось в очереди в момент обработки"""
+
+    def __init__(self):
+        self.handler: QueuedRequestHandler | None = None
+        self.seen: list[tuple[str, int, float]] = []
+
+    async def feed_raw_update(self, bot, update, **kwargs):
+        self.seen.append((update["message"]["text"], self.handler.queued, time.monotonic()))
+        await asyncio.sleep(0.01)
+
+
+def text(update_id: int, value: str) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": value,
+        "chat": {"id": 1, "type": "private"}, "from": {"id": 1, "is_bot": False, "first_name": "T"},
+    }}
+
+
+def run(scenario) -> FakeDispatcher:
+    async def main() -> FakeDispatcher:
+        dispatcher = FakeDispatcher()
+        handler = dispatcher.handler = QueuedRequestHandler(dispatcher, bot=None, merge_window=0.05)
+        await scenario(handler)
+        while handler.queued:
+            await asyncio.sleep(0.01)
+        return dispatcher
+
+    return asyncio.run(main())
+
+
+def test_burst_is_merged_inside_queue():
+    async def scenario(handler):
+        for i in range(5):
+            handler.enqueue(None, text(i, f"строка {i}"))
+        await asyncio.sleep(0.02)
+        # Часть, пришедшая в окне, дописывается к уже собранным
+        handler.enqueue(None, text(5, "строка 5"))
+
+    dispatcher = run(scenario)
+    assert [value for value, _, _ in dispatcher.seen] == ["\n".join(f"строка {i}" for i in range(6))]
+    # Склеенные апдейты числятся в очереди, пока их обрабатывают
+    assert dispatcher.seen[0][1] == 6
+
+
+def test_single_message_is_not_delayed():
+    started = []
+
+    async def scenario(handler):
+        started.append(time.monotonic())
+        handler.enqueue(None, text(1, "ответ"))
+
+    dispatcher = run(scenario)
+    assert [value for value, _, _ in dispatcher.seen] == ["ответ"]
+    assert dispatcher.seen[0][2] - started[0] < 0.05
+
+
+def test_commands_are_not_merged():
+    async def scenario(handler):
+        handler.enqueue(None, text(1, "ответ"))
+        handler.enqueue(None, text(2, "/start"))
+        handler.enqueue(None, text(3, "ещё"))
+
+    dispatcher = run(scenario)
+    assert [value for value, _, _ in dispatcher.seen] == ["ответ", "/start", "ещё"]
+
+
+def test_restart_keeps_updates_rejected_out_of_order(tmp_path):
+    path = str(tmp_path / "last_update_id")
+    deduplicator = UpdateDeduplicator(path=path)
+    # 102 отклонён 503 при полной очереди, 103 пришёл параллельно и принят
+    for update_id in (100, 101, 103):
+        assert not deduplicator.seen(update_id)
+    deduplicator.save()
+
+    restarted = UpdateDeduplicator(path=path)
+    assert restarted.seen(101) and restarted.seen(103)
+    assert not restarted.seen(102)
+    assert restarted.watermark == 103
+
+
+def test_forget_moves_watermark_back(tmp_path):
+    path = str(tmp_path / "last_update_id")
+    deduplicator = UpdateDeduplicator(path=path)
+    for update_id in (100, 101, 102):
+        deduplicator.seen(update_id)
+    # Воркер не принял 101 — фронт снимает отметку
+    deduplicator.forget(101)
+    deduplicator.save()
+
+    restarted = UpdateDeduplicator(path=path)
+    assert restarted.seen(100) and restarted.seen(102)
+    assert not restarted.seen(101)
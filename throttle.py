@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import time
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import DeleteMessage, DeleteMessages, TelegramMethod
+
+logger = logging.getLogger(__name__)
+
+# ——— ПРИОРИТЕТЫ (меньше — раньше) ———
+PRIORITY_REPLY = 0        # ответы пользователю в анкете
+PRIORITY_BACKGROUND = 1   # служебные отправки, например заявки админу
+PRIORITY_CLEANUP = 2      # удаление старых вопросов
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "parked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.parked_until = 0.0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Сколько ждать до следующего токена (0 — можно отправлять сейчас)"""
+        if now < self.parked_until:
+            return self.parked_until - now
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def park(self, seconds: float) -> None:
+        self.parked_until = max(self.parked_until, time.monotonic() + seconds)
+
+
+class _Request:
+    __slots__ = ("priority", "seq", "chat_id", "future", "enqueued_at")
+
+    def __init__(self, priority: int, seq: int, chat_id: Any, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов к Bot API.
+
+    Подключается как middleware сессии бота. Каждый запрос с `chat_id` ждёт
+    токен глобального ведра (~30 сообщений/с) и ведра своего чата (~1/с),
+    очередь разбирается по приоритету: ответы пользователю идут раньше заявок
+    админу, а те — раньше удаления старых вопросов. Удаление не отправляет
+    сообщений и токенов чата не тратит, чтобы фоновая очистка не отнимала лимит
+    у ответов. На TelegramRetryAfter чат «паркуется» на указанное время — это
+    касается и удалений, — а запрос встаёт в очередь снова.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        background_chats: set[int] | None = None,
+        max_retries: int = 5,
+        max_chat_buckets: int = 10_000,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.background_chats = background_chats or set()
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+
+        self._chat_buckets: dict[Any, TokenBucket] = {}
+        self._queue: list[_Request] = []
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+
+        # Статистика
+        self.granted = 0
+        self.retry_after_count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    # ——— MIDDLEWARE СЕССИИ ———
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # getMe, setWebhook и т.п. не ограничиваем
+            return await make_request(bot, method)
+
+        priority = self.priority_for(method, chat_id)
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after_count += 1
+                if attempt == self.max_retries:
+                    raise
+                logger.warning("429 от Bot API для чата %s, ждём %s с", chat_id, e.retry_after)
+                self._chat_bucket(chat_id).park(e.retry_after)
+
+    def priority_for(self, method: TelegramMethod, chat_id: Any) -> int:
+        if isinstance(method, (DeleteMessage, DeleteMessages)):
+            return PRIORITY_CLEANUP
+        if chat_id in self.background_chats:
+            return PRIORITY_BACKGROUND
+        return PRIORITY_REPLY
+
+    # ——— ОЧЕРЕДЬ ———
+    async def acquire(self, chat_id: Any, priority: int = PRIORITY_REPLY) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        request = _Request(priority, self._seq, chat_id, future)
+        self._queue.append(request)
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        self._wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if request in self._queue:
+                self._queue.remove(request)
+            raise
+
+        waited = time.monotonic() - request.enqueued_at
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chat_buckets:
+                self._prune_buckets()
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _prune_buckets(self) -> None:
+        # Полное ведро без ожидающих запросов ничем не отличается от нового
+        now = time.monotonic()
+        waiting = {request.chat_id for request in self._queue}
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            if chat_id not in waiting and now >= bucket.parked_until:
+                bucket.refill(now)
+                if bucket.tokens >= bucket.capacity:
+                    del self._chat_buckets[chat_id]
+
+    async def _run(self) -> None:
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            delay = self.global_bucket.wait_time(now)
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+
+            # Самый приоритетный запрос, чей чат сейчас может принять сообщение
+            best, best_index, delay = None, -1, float("inf")
+            for index, request in enumerate(self._queue):
+                if best is not None and (request.priority, request.seq) > (best.priority, best.seq):
+                    continue
+                bucket = self._chat_bucket(request.chat_id)
+                if request.priority == PRIORITY_CLEANUP:
+                    chat_delay = max(bucket.parked_until - now, 0.0)
+                else:
+                    chat_delay = bucket.wait_time(now)
+                if chat_delay:
+                    delay = min(delay, chat_delay)
+                else:
+                    best, best_index = request, index
+
+            if best is None:
+                # Все ожидающие чаты упёрлись в лимит — спим до ближайшего токена или нового запроса
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._queue.pop(best_index)
+            if best.future.done():
+                continue
+            self.global_bucket.take()
+            if best.priority != PRIORITY_CLEANUP:
+                self._chat_bucket(best.chat_id).take()
+            self.granted += 1
+            best.future.set_result(None)
+            # Отдаём управление, чтобы разблокированный запрос ушёл в сеть
+            await asyncio.sleep(0)
+
+    # ——— СТАТИСТИКА ———
+    def stats(self) -> dict[str, Any]:
+        depth = [0, 0, 0]
+        for request in self._queue:
+            depth[request.priority] += 1
+        return {
+            "queue_depth": len(self._queue),
+            "queue_depth_reply": depth[PRIORITY_REPLY],
+            "queue_depth_background": depth[PRIORITY_BACKGROUND],
+            "queue_depth_cleanup": depth[PRIORITY_CLEANUP],
+            "granted": self.granted,
+            "retry_after": self.retry_after_count,
+            "avg_wait": self.total_wait / self.granted if self.granted else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
@@ -0,0 +1,108 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+# Больше спанов в одной трассе не пишем: апдейт не должен копить память, что бы ни делал обработчик
+MAX_SPANS = 64
+
+
+class Trace:
+    """Трасса одного апдейта: спаны (имя, начало от старта апдейта, длительность) в секундах"""
+    __slots__ = ("update_id", "state", "started", "spans", "finished")
+
+    def __init__(self, update_id: int):
+        self.update_id = update_id
+        self.state: str | None = None
+        self.started = time.perf_counter()
+        self.spans: list[tuple[str, float, float]] = []
+        self.finished = False
+
+    def add(self, name: str, started: float, duration: float) -> None:
+        # Фоновые задачи, созданные во время апдейта, наследуют его контекст —
+        # после конца апдейта их вызовы в трассу уже не попадают
+        if not self.finished and len(self.spans) < MAX_SPANS:
+            self.spans.append((name, started - self.started, duration))
+
+    def describe(self, total: float) -> str:
+        parts = [f"{name} {duration * 1000:.0f} мс (+{offset * 1000:.0f})" for name, offset, duration in self.spans]
+        # Спаны могут идти параллельно, поэтому «остальное» не бывает меньше нуля
+        rest = max(total - sum(duration for _, _, duration in self.spans), 0.0)
+        parts.append(f"диспетчер и обработчик {rest * 1000:.0f} мс")
+        return f"апдейт {self.update_id} [{self.state or 'без состояния'}] {total * 1000:.0f} мс: " + ", ".join(parts)
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Спан в трассе текущего апдейта; вне апдейта ничего не делает"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, started, time.perf_counter() - started)
+
+
+class UpdateTracer(BaseMiddleware):
+    """
+    Внешний middleware апдейтов: трасса каждого апдейта со спанами Bot API и хранилища.
+
+    Трасса — несколько чисел в памяти на время апдейта; в лог она попадает, только
+    если апдейт обрабатывался дольше `slow_threshold` секунд. Регистрировать раньше
+    FSM-middleware диспетчера, чтобы в трассу попало и чтение состояния.
+    """
+
+    def __init__(self, slow_threshold: float):
+        self.slow_threshold = slow_threshold
+        self.slow = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        trace = Trace(event.update_id if isinstance(event, Update) else 0)
+        token = _current_trace.set(trace)
+        try:
+            return await handler(event, data)
+        finally:
+            _current_trace.reset(token)
+            trace.finished = True
+            total = time.perf_counter() - trace.started
+            if total >= self.slow_threshold:
+                # Внутренние middleware дописывают в тот же словарь — состояние Form уже в нём
+                trace.state = data.get("raw_state")
+                self.slow += 1
+                logger.warning("Медленный %s", trace.describe(total))
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: вызов Bot API — спан в трассе апдейта. Регистрировать
+    первым, снаружи планировщика: апдейт ждёт и очередь лимитов, и сам запрос.
+    """
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        trace = _current_trace.get()
+        if trace is None:
+            return await make_request(bot, method)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            trace.add(method.__api_method__, started, time.perf_counter() - started)
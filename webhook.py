@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_key(update: dict[str, Any]) -> Any:
+    """Чат (или пользователь), к которому относится апдейт, — по нему держим порядок"""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+    return update.get("update_id")
+
+
+def merge_key(update: dict[str, Any]) -> tuple[int, int] | None:
+    """(чат, отправитель) обычного текста — такие апдейты можно склеить; команды и файлы — None"""
+    message = update.get("message")
+    if not message or "from" not in message:
+        return None
+    text = message.get("text")
+    if not text or text.startswith("/"):
+        return None
+    return message["chat"]["id"], message["from"]["id"]
+
+
+def merge_texts(updates: list[dict[str, Any]]) -> dict[str, Any]:
+    """Один апдейт из нескольких текстов: от имени последнего, его message_id самый свежий"""
+    last = updates[-1]
+    message = {**last["message"], "text": "\n".join(update["message"]["text"] for update in updates)}
+    # Разметка частей к склеенному тексту не относится — смещения entities были бы неверны
+    message.pop("entities", None)
+    return {**last, "message": message}
+
+
+class UpdateDeduplicator:
+    """
+    Отсекает повторные доставки одного и того же update_id.
+
+    Недавние id держатся в OrderedDict в порядке прихода, так что проверка и
+    вытеснение по TTL/размеру — O(1). Если задан `path`, на диск сохраняется
+    граница `watermark` — все id до неё включительно приняты, пропусков нет — и
+    принятые id выше неё, ещё не вытесненные по TTL. После рестарта дублем
+    считается только это. Одну лишь наибольшую границу хранить нельзя: Telegram
+    шлёт апдейты параллельно, и отклонённый 503 апдейт бывает старше уже принятых —
+    его повтор после рестарта должен пройти.
+    """
+
+    # Telegram выбирает update_id заново, если апдейтов не было неделю
+    HIGH_WATER_MAX_AGE = 6 * 24 * 3600
+
+    def __init__(self, ttl: float = 600.0, max_size: int = 100_000, path: str | None = None, save_interval: float = 10.0):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.path = path
+        self.save_interval = save_interval
+        self._seen: OrderedDict[int, float] = OrderedDict()
+        self.watermark: int | None = None
+        self._restored_watermark = self._load()
+        self._saved_at = time.monotonic()
+        self.dropped = 0
+
+    def seen(self, update_id: int) -> bool:
+        """True, если апдейт уже приходил (и счётчик дублей увеличен)"""
+        now = time.monotonic()
+        while self._seen:
+            oldest_id, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < self.ttl and len(self._seen) < self.max_size:
+                break
+            del self._seen[oldest_id]
+
+        if update_id in self._seen or update_id <= self._restored_watermark:
+            self.dropped += 1
+            return True
+
+        self._seen[update_id] = now
+        if self.watermark is None:
+            self.watermark = update_id - 1
+        # Граница идёт только по сплошному ряду принятых id
+        while self.watermark + 1 in self._seen:
+            self.watermark += 1
+        if self.path and now - self._saved_at >= self.save_interval:
+            self.save()
+        return False
+
+    def forget(self, update_id: int) -> None:
+        """Снимает отметку: апдейт не удалось принять, и повтор Telegram не должен считаться дублем"""
+        self._seen.pop(update_id, None)
+        if self.watermark is not None and update_id <= self.watermark:
+            self.watermark = update_id - 1
+
+    def _load(self) -> int:
+        if not self.path:
+            return 0
+        try:
+            with open(self.path) as f:
+                header, *rest = f.read().split("\n", 1)
+                watermark, saved_at = header.split()
+                accepted = [int(update_id) for update_id in rest[0].split()] if rest else []
+        except (OSError, ValueError):
+            return 0
+        if time.time() - float(saved_at) > self.HIGH_WATER_MAX_AGE:
+            return 0
+        # Принятые выше границы помним как недавние — до TTL и в следующем сохранении
+        now = time.monotonic()
+        for update_id in accepted:
+            self._seen[update_id] = now
+        self.watermark = int(watermark)
+        return self.watermark
+
+    def save(self) -> None:
+        if not self.path or self.watermark is None:
+            return
+        self._saved_at = time.monotonic()
+        accepted = " ".join(str(update_id) for update_id in self._seen if update_id > self.watermark)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(f"{self.watermark} {time.time()}\n{accepted}")
+        os.replace(tmp_path, self.path)
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """
+    Webhook-обработчик, который отвечает Telegram сразу, а апдейт обрабатывает в фоне.
+
+    Апдейты раскладываются по очередям своих чатов: внутри чата они обрабатываются
+    строго по порядку, разные чаты — параллельно, но не больше `workers` одновременно.
+    Если в очередях уже `max_queue` апдейтов, новый отклоняется с 503 — Telegram
+    повторит доставку позже. Повторные доставки отсекает `deduplicator` до постановки
+    в очередь, то есть до любой работы с хранилищем и Bot API.
+
+    Если чат шлёт текст быстрее, чем обрабатывается (вставка из 20 строк, длинный
+    текст, порезанный клиентом), обычные тексты, уже ждущие в очереди чата подряд,
+    склеиваются через перевод строки в один апдейт. Найдя такой всплеск, обработчик
+    ещё до `merge_window` секунд ждёт следующих частей (не дольше `max_merge_delay`
+    с начала), держа место воркера и счёт очереди. Чат без очереди не ждёт ничего.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        workers: int = 16,
+        max_queue: int = 1000,
+        deduplicator: UpdateDeduplicator | None = None,
+        merge_window: float = 0.3,
+        max_merge_delay: float = 2.0,
+        **kwargs: Any,
+    ):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self.max_queue = max_queue
+        self.deduplicator = deduplicator
+        self.merge_window = merge_window
+        self.max_merge_delay = max_merge_delay
+        self._slots = asyncio.Semaphore(workers)
+        self._chats: dict[Any, deque] = {}
+        self._waiters: dict[Any, asyncio.Future] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.queued = 0
+        self.rejected = 0
+        self.merged = 0
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            return web.Response(status=503, headers={"Retry-After": "1"})
+
+        update = await request.json(loads=bot.session.json_loads)
+        if self.deduplicator is None or not self.deduplicator.seen(update["update_id"]):
+            self.enqueue(bot, update)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    def enqueue(self, bot: Bot, update: dict[str, Any]) -> None:
+        self.queued += 1
+        chat_key = update_chat_key(update)
+        queue = self._chats.get(chat_key)
+        if queue is not None:
+            # У чата уже есть обработчик — он заберёт апдейт по порядку
+            queue.append(update)
+            waiter = self._waiters.get(chat_key)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+            return
+        self._chats[chat_key] = deque([update])
+        task = asyncio.create_task(self._drain(bot, chat_key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, bot: Bot, chat_key: Any) -> None:
+        queue = self._chats[chat_key]
+        try:
+            while queue:
+                batch = [queue.popleft()]
+                try:
+                    async with self._slots:
+                        if queue and self.merge_window > 0:
+                            await self._collect(chat_key, queue, batch)
+                        await self._process(bot, merge_texts(batch) if len(batch) > 1 else batch[0])
+                finally:
+                    self.queued -= len(batch)
+        finally:
+            del self._chats[chat_key]
+
+    async def _collect(self, chat_key: Any, queue: deque, batch: list[dict[str, Any]]) -> None:
+        """Дописывает в batch части текста того же отправителя, ждущие в очереди и приходящие следом"""
+        key = merge_key(batch[0])
+        if key is None:
+            return
+        deadline = time.monotonic() + self.max_merge_delay
+        while True:
+            while queue and merge_key(queue[0]) == key:
+                batch.append(queue.popleft())
+                self.merged += 1
+            # Следом за текстом — другой апдейт или склеивать нечего: порядок важнее
+            timeout = min(self.merge_window, deadline - time.monotonic())
+            if queue or len(batch) == 1 or timeout <= 0:
+                return
+            waiter = self._waiters[chat_key] = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                return
+            finally:
+                del self._waiters[chat_key]
+
+    async def _process(self, bot: Bot, update: dict[str, Any]) -> None:
+        try:
+            result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=bot, result=result)
+        except Exception:
+            logger.exception("Ошибка обработки апдейта %s", update.get("update_id"))
+
+    async def close(self) -> None:
+        # Только дообрабатываем принятое. Сессию бота не закрываем: после нас ещё
+        # работают хуки остановки диспетчера, которым нужен Bot API
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=10)
+        if self.deduplicator is not None:
+            self.deduplicator.save()